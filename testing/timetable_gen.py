@@ -1,7 +1,6 @@
 import random
 import webbrowser
 import os
-import copy
 from collections import defaultdict
 
 # ==========================================
@@ -135,6 +134,7 @@ LAB_TASKS = [
 # ==========================================
 
 class Teacher:
+    __slots__ = ("id", "name", "current_load", "max_load")
     def __init__(self, id, name):
         self.id = id
         self.name = name
@@ -144,6 +144,8 @@ class Teacher:
     def __repr__(self): return self.name
 
 class Gene:
+    __slots__ = ("div", "type", "subject", "lab_subjects", "duration", "teacher", "teachers_list", "batch",
+                 "day", "slot", "assigned_room")
     def __init__(self, div, type, subject, teacher=None, duration=1, lab_subjects=None, teachers_list=None, batch=None):
         self.div = div
         self.type = type 
@@ -382,7 +384,7 @@ def run_solver(iterations=5000):
     print("--- Starting Final Solver (Zero Gaps + Anti-Trap + Home Rooms) ---")
     base_genes = distribute_workload()
     best_fitness = -float('inf')
-    best_sched = None
+    best_placement = None
     
     def priority_sort(g):
         if "BE" in g.div: return 0  
@@ -394,7 +396,9 @@ def run_solver(iterations=5000):
     base_genes.sort(key=priority_sort)
 
     for run in range(iterations):
-        all_genes = copy.deepcopy(base_genes)
+        # Genes are reused across runs; only their placement is reset
+        all_genes = base_genes
+        for g in all_genes: g.day = -1; g.slot = -1; g.assigned_room = []
         schedule = Schedule(all_genes)
         unplaced = []
         
@@ -469,10 +473,16 @@ def run_solver(iterations=5000):
 
         if score > best_fitness:
             best_fitness = score
-            best_sched = schedule
+            best_placement = [(g.day, g.slot, g.assigned_room) for g in all_genes]
             print(f"Run {run}: Score {score} (Unplaced: {len(unplaced)}, Gaps: {total_gaps})")
             if len(unplaced) == 0 and total_gaps == 0: break 
-            
+
+    if best_placement is None: return None
+    best_sched = Schedule(base_genes)
+    for g, (d, s, rms) in zip(base_genes, best_placement):
+        g.day = -1; g.slot = -1; g.assigned_room = []
+        if d != -1:
+            best_sched.book(g, d, s, rms, g.teachers_list if g.teachers_list else [g.teacher])
     return best_sched
 
 # ==========================================
@@ -49,6 +49,8 @@ class TimetableRequest(BaseModel):
 
 # 3. V66 ALGORITHM LOGIC ADAPTED FOR API
 class Teacher:
+    __slots__ = ("id", "name", "role", "experience", "shift", "skills", "current_load", "max_load")
+
     def __init__(self, data: TeacherInput):
         self.id = data.id
         self.name = data.name
@@ -72,6 +74,9 @@ class Teacher:
         return self.current_load + duration <= self.max_load
 
 class Gene:
+    __slots__ = ("div", "type", "subject", "lab_subjects", "duration", "teacher",
+                 "day", "slot", "assigned_room", "assigned_teachers")
+
     def __init__(self, div, type, subject, teacher=None, duration=1, lab_subjects=None):
         self.div = div
         self.type = type
@@ -176,6 +181,11 @@ async def generate_timetable(req: TimetableRequest):
     teacher_map = {t.id: Teacher(t) for t in req.faculty}
     all_teachers = list(teacher_map.values())
     all_genes = []
+
+    # Index allocations once: (division, subject) -> teacher id (first wins)
+    alloc_index = {}
+    for a in req.allocations:
+        alloc_index.setdefault((a.division, a.subject_name), a.teacher_id)
     
     # Build Workload
     for year, divs in req.divisions.items():
@@ -185,7 +195,7 @@ async def generate_timetable(req: TimetableRequest):
             theory_subs = [s for s in year_subjects if s.type == 'Theory']
             for sub in theory_subs:
                 # Find allocated teacher
-                assigned_id = next((a.teacher_id for a in req.allocations if a.subject_name == sub.name and a.division == div), None)
+                assigned_id = alloc_index.get((div, sub.name))
                 teacher = teacher_map.get(assigned_id)
                 
                 # Update Load
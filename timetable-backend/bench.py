@@ -0,0 +1,171 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import time
+from collections import Counter
+
+from synthetic import generate
+
+# ==========================================
+# SOLVER BENCHMARK SUITE
+# ==========================================
+# python bench.py [--suite small] [--engines heuristic,exact] [--runs N]
+# Solves every instance of a suite with every engine, each case in a fresh
+# process, and writes one JSON file per invocation (tagged with the git
+# commit) so results can be compared across commits:
+# python bench.py --compare old.json new.json
+
+SUITES = {
+    "small": [
+        dict(years=("SE",), divisions=1),
+        dict(years=("SE", "TE"), divisions=1),
+        dict(years=("SE", "TE"), divisions=1, days=3, tightness=0.95),
+    ],
+    "medium": [
+        dict(years=("SE", "TE", "BE"), divisions=2),
+        dict(years=("SE", "TE", "BE"), divisions=2, tightness=0.9),
+        dict(years=("SE", "TE", "BE"), divisions=2, teachers=14, theory_rooms=4),
+    ],
+    "large": [
+        dict(years=("SE", "TE", "BE"), divisions=3, teachers=36),
+        dict(years=("SE", "TE", "BE"), divisions=4, teachers=48, theory_rooms=8, lab_rooms=8),
+        dict(years=("SE", "TE", "BE"), divisions=4, teachers=36, tightness=0.9),
+    ],
+    "campus": [
+        # Departments share only rooms, so these decompose (no campus-wide special lab)
+        dict(years=("SE", "TE", "BE"), divisions=2, departments=3, special_labs=0, theory_rooms=18, lab_rooms=12),
+        dict(years=("SE", "TE", "BE"), divisions=2, departments=4, special_labs=0, theory_rooms=16, lab_rooms=12),
+    ],
+}
+ENGINES = ("heuristic", "exact")
+
+def run_case(instance, engine, runs, seed):
+    # Runs in a child process: counts hot-path calls by wrapping them in this
+    # process only and reports its own peak RSS.
+    import main
+
+    calls = Counter()
+    def counted(name, fn):
+        def wrapper(*args, **kwargs):
+            calls[name] += 1
+            return fn(*args, **kwargs)
+        return wrapper
+
+    # Runs are counted at construct(); the first one leaving nothing unplaced
+    # is "runs to first feasible".
+    first_feasible = []
+    construct = main.construct
+    def counted_construct(*args, **kwargs):
+        calls["construct"] += 1
+        unplaced = construct(*args, **kwargs)
+        if not unplaced and not first_feasible: first_feasible.append(calls["construct"])
+        return unplaced
+    main.construct = counted_construct
+    main.score_candidates = counted("score_candidates", main.score_candidates)
+    main.get_rooms_for_gene = counted("get_rooms_for_gene", main.get_rooms_for_gene)
+    main.Schedule.is_free = counted("is_free", main.Schedule.is_free)
+    exact_nodes = []
+    exact_run = main.ExactSearch.run
+    def counted_run(self):
+        result = exact_run(self)
+        exact_nodes.append(self.nodes)
+        return result
+    main.ExactSearch.run = counted_run
+    main.SOLVER_RUNS = runs
+
+    req = main.TimetableRequest(**generate(seed=seed, **instance))
+    started = time.perf_counter()
+    model = main.compile_model(req)
+    genes = main.build_genes(model)
+    req.solver = engine
+    schedule = main.solve_model(req, model, genes, main.Budget(), seed, workers=1)
+    wall = time.perf_counter() - started
+
+    unplaced = [g for g in genes if schedule is None or schedule.day[g.idx] == -1]
+    score, gaps, sparse = main.score_schedule(schedule, unplaced) if schedule else (None, None, None)
+    return {
+        "engine": engine,
+        "genes": len(genes),
+        "wall_time": round(wall, 4),
+        "runs": calls["construct"],
+        "runs_to_first_feasible": first_feasible[0] if first_feasible else None,
+        "exact_nodes": exact_nodes[0] if exact_nodes else None,
+        "unplaced": len(unplaced),
+        "gaps": gaps,
+        "sparse_days": sparse,
+        "score": score,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "calls": {name: calls[name] for name in ("construct", "score_candidates", "get_rooms_for_gene", "is_free")},
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def run_suite(suite, engines, runs, seed):
+    ctx = multiprocessing.get_context("spawn")
+    cases = []
+    for k, instance in enumerate(SUITES[suite]):
+        for engine in engines:
+            with ctx.Pool(1) as pool:
+                result = pool.apply(run_case, (instance, engine, runs, seed))
+            result["instance"] = {"suite": suite, "index": k, **instance}
+            cases.append(result)
+            print(f"{suite}[{k}] {engine:9} {result['wall_time']:8.2f}s  unplaced={result['unplaced']} "
+                  f"gaps={result['gaps']} sparse={result['sparse_days']} runs={result['runs']} "
+                  f"first_feasible={result['runs_to_first_feasible']}", flush=True)
+    return cases
+
+def compare(old_path, new_path):
+    with open(old_path) as f: old = json.load(f)
+    with open(new_path) as f: new = json.load(f)
+    key = lambda c: (c["instance"]["suite"], c["instance"]["index"], c["engine"])
+    before = {key(c): c for c in old["cases"]}
+    print(f"{old.get('commit')} -> {new.get('commit')}")
+    for case in new["cases"]:
+        prev = before.get(key(case))
+        if prev is None: continue
+        suite, index, engine = key(case)
+        print(f"{suite}[{index}] {engine:9} time {prev['wall_time']:.2f}s -> {case['wall_time']:.2f}s  "
+              f"unplaced {prev['unplaced']} -> {case['unplaced']}  gaps {prev['gaps']} -> {case['gaps']}  "
+              f"sparse {prev['sparse_days']} -> {case['sparse_days']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Timetable solver benchmarks")
+    parser.add_argument("--suite", default="small", choices=sorted(SUITES))
+    parser.add_argument("--engines", default=",".join(ENGINES))
+    parser.add_argument("--runs", type=int, default=500, help="restart budget per solve")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="bench_results")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    engines = [e for e in args.engines.split(",") if e]
+    for e in engines:
+        if e not in ENGINES: parser.error(f"unknown engine {e}")
+    cases = run_suite(args.suite, engines, args.runs, args.seed)
+
+    commit = git_commit()
+    report = {
+        "commit": commit, "timestamp": time.time(), "suite": args.suite, "runs": args.runs, "seed": args.seed,
+        "python": platform.python_version(), "cpu_count": os.cpu_count(), "cases": cases,
+    }
+    os.makedirs(args.out, exist_ok=True)
+    path = os.path.join(args.out, f"{args.suite}-{commit or 'nogit'}-{int(report['timestamp'])}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {path}")
+
+if __name__ == "__main__":
+    main()
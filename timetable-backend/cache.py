@@ -0,0 +1,99 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger("TimetableSolver")
+
+# ==========================================
+# CONTENT-ADDRESSED RESULT CACHE
+# ==========================================
+# Results are keyed by a hash of the normalized request (including its seed),
+# kept in a bounded in-memory LRU and optionally mirrored to a directory of
+# JSON files. Entries expire after max_age seconds in both tiers. The disk
+# tier is best-effort: a failed read is a miss, a failed write is logged.
+
+def request_key(payload, version):
+    # `payload` is the request as plain JSON data; keys are sorted so field
+    # order in the incoming body does not matter.
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{version}:{canonical}".encode()).hexdigest()
+
+class ResultCache:
+    def __init__(self, max_entries=64, max_age=86400, directory=None, max_disk_entries=1000):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.directory = directory
+        self.max_disk_entries = max_disk_entries
+        self.entries = OrderedDict()   # key -> (stored at, result)
+        self.lock = threading.Lock()
+        if directory: os.makedirs(directory, exist_ok=True)
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            hit = self.entries.get(key)
+            if hit is not None:
+                if now - hit[0] <= self.max_age:
+                    self.entries.move_to_end(key)
+                    return hit[1]
+                del self.entries[key]
+
+        result = self._read_disk(key, now)
+        if result is not None:
+            self._remember(key, result, now)
+        return result
+
+    def put(self, key, result):
+        now = time.time()
+        self._remember(key, result, now)
+        self._write_disk(key, result)
+
+    def _remember(self, key, result, now):
+        with self.lock:
+            self.entries[key] = (now, result)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    # --- disk tier ---
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _read_disk(self, key, now):
+        if not self.directory: return None
+        path = self._path(key)
+        try:
+            if now - os.path.getmtime(path) > self.max_age:
+                os.remove(path)
+                return None
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key, result):
+        if not self.directory: return
+        path = self._path(key)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(result, f)
+            os.replace(tmp, path)
+            self._evict_disk()
+        except OSError as e:
+            logger.warning(f"Result cache write failed for {key[:12]}: {e}")
+            try: os.remove(tmp)
+            except OSError: pass
+
+    def _evict_disk(self):
+        files = [os.path.join(self.directory, n) for n in os.listdir(self.directory) if n.endswith(".json")]
+        if len(files) <= self.max_disk_entries: return
+        files.sort(key=os.path.getmtime)
+        for path in files[:len(files) - self.max_disk_entries]:
+            try: os.remove(path)
+            except OSError: pass
@@ -0,0 +1,167 @@
+import csv
+import html
+import io
+from collections import defaultdict
+
+from fastapi import HTTPException
+
+try:
+    import openpyxl   # optional: only XLSX export needs it
+except ImportError:
+    openpyxl = None
+
+# ==========================================
+# TIMETABLE EXPORT
+# ==========================================
+# Renders a finished timetable (the division -> day -> entries JSON the API
+# returns) as division, teacher and room timetables. The entries are indexed
+# once by (owner, day, slot) for all three views; the renderers walk that
+# index and yield their output in chunks, one timetable at a time.
+
+VIEWS = ("division", "teacher", "room")
+FORMATS = {
+    "html": "text/html; charset=utf-8",
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+# Placeholder teacher / room names that are nobody's timetable
+UNASSIGNED = {"", "TBA", "Multiple", "Location TBA", "?"}
+
+def sessions(entry):
+    # (subject, teacher, room, batch) for each teacher / room of an entry
+    if entry.get("batches"):
+        return [(b.get("subject"), b.get("teacher"), b.get("room"), b.get("batch")) for b in entry["batches"]]
+    if entry.get("type") == "ELECTIVE":
+        subjects, teachers, rooms = (str(entry.get(k) or "").split(" / ") for k in ("subject", "teacher", "room"))
+        return [(s, teachers[i] if i < len(teachers) else None, rooms[i] if i < len(rooms) else None, None)
+                for i, s in enumerate(subjects)]
+    return [(entry.get("subject"), entry.get("teacher"), entry.get("room"), None)]
+
+class TimetableIndex:
+    # view -> owner -> (day, slot) -> records; a record is
+    # (division, type, subject, teacher, room, batch, continued) for one
+    # session covering the slot. A lab lists every batch in the division view
+    # but only its own session in a teacher / room view.
+    def __init__(self, timetable, days, slots_per_day, recess_index=-1):
+        self.days = list(days)
+        self.slots = slots_per_day
+        self.recess = recess_index
+        self.cells = {view: defaultdict(lambda: defaultdict(list)) for view in VIEWS}
+        day_index = {d: i for i, d in enumerate(self.days)}
+        for div, week in timetable.items():
+            for day, entries in week.items():
+                d = day_index.get(day)
+                if d is None: continue
+                for entry in entries:
+                    start, duration = entry.get("slot", 0), entry.get("duration", 1)
+                    parts = sessions(entry)
+                    for s in range(max(start, 0), min(start + duration, slots_per_day)):
+                        for subject, teacher, room, batch in parts:
+                            record = (div, entry.get("type"), subject, teacher, room, batch, s > start)
+                            self.cells["division"][div][(d, s)].append(record)
+                            if teacher not in UNASSIGNED and teacher is not None:
+                                self.cells["teacher"][teacher][(d, s)].append(record)
+                            if room not in UNASSIGNED and room is not None:
+                                self.cells["room"][room][(d, s)].append(record)
+
+    def owners(self, view):
+        return sorted(self.cells[view])
+
+    def grid(self, view, owner):
+        return self.cells[view].get(owner, {})
+
+def label(view, record):
+    # One line of a cell; the view's own owner is left out
+    div, _, subject, teacher, room, batch, continued = record
+    parts = [div] if view != "division" else []
+    parts.append(f"{subject} ({batch})" if batch else str(subject))
+    if view != "teacher" and teacher: parts.append(str(teacher))
+    if view != "room" and room: parts.append(f"[{room}]")
+    if continued: parts.append("(cont.)")
+    return " ".join(parts)
+
+def render_csv(index, views):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["view", "name", "day", "slot", "division", "type", "subject", "teacher", "room", "batch", "continued"])
+    for view in views:
+        for owner in index.owners(view):
+            grid = index.grid(view, owner)
+            for (d, s) in sorted(grid):
+                for div, kind, subject, teacher, room, batch, continued in grid[(d, s)]:
+                    writer.writerow([view, owner, index.days[d], s, div, kind, subject, teacher, room, batch or "",
+                                     "yes" if continued else ""])
+            yield buffer.getvalue()
+            buffer.seek(0); buffer.truncate()
+    yield buffer.getvalue()
+
+HTML_STYLE = """<style>
+body { font-family: 'Segoe UI', Roboto, Helvetica, Arial, sans-serif; background: #f0f2f5; padding: 20px; color: #333; }
+section { background: white; margin-bottom: 32px; border-radius: 12px; border: 1px solid #e0e0e0; overflow: hidden; page-break-inside: avoid; }
+h2 { background: #2c3e50; color: white; margin: 0; padding: 14px 20px; font-size: 18px; border-bottom: 4px solid #3498db; }
+table { width: 100%; border-collapse: collapse; table-layout: fixed; }
+th { background: #34495e; color: #ecf0f1; padding: 8px; font-size: 12px; }
+td { border: 1px solid #e0e0e0; height: 64px; vertical-align: middle; text-align: center; padding: 4px; font-size: 11px; }
+td.day { font-weight: bold; background: #f7f9fa; }
+.break { background: #dfe6e9; font-weight: bold; color: #7f8c8d; }
+.THEORY { background-color: #e3f2fd; } .LAB { background-color: #fff3e0; }
+.ELECTIVE { background-color: #fce4ec; } .MATHS_TUT { background-color: #e8f5e9; }
+.item { display: block; }
+</style>"""
+
+def render_html(index, views):
+    yield f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>Timetables</title>{HTML_STYLE}</head><body>"
+    header = "".join(f"<th>{s + 1}</th>" for s in range(index.slots))
+    for view in views:
+        for owner in index.owners(view):
+            grid = index.grid(view, owner)
+            rows = [f"<section><h2>{html.escape(view.title())}: {html.escape(owner)}</h2>"
+                    f"<table><thead><tr><th>Day</th>{header}</tr></thead><tbody>"]
+            for d, day in enumerate(index.days):
+                cells = [f"<tr><td class='day'>{html.escape(day)}</td>"]
+                for s in range(index.slots):
+                    records = grid.get((d, s))
+                    if not records:
+                        cells.append("<td class='break'>RECESS</td>" if s == index.recess else "<td></td>")
+                        continue
+                    items = "".join(f"<span class='item'>{html.escape(label(view, r))}</span>" for r in records)
+                    cells.append(f"<td class='{html.escape(str(records[0][1]))}'>{items}</td>")
+                rows.append("".join(cells) + "</tr>")
+            rows.append("</tbody></table></section>")
+            yield "".join(rows)
+    yield "</body></html>"
+
+def render_xlsx(index, views):
+    # One sheet per view with the owners' grids stacked; write-only mode
+    # streams rows to the workbook, the finished file is one chunk.
+    if openpyxl is None:
+        raise HTTPException(status_code=501, detail="XLSX export needs the openpyxl package")
+    workbook = openpyxl.Workbook(write_only=True)
+    header = ["Day"] + [s + 1 for s in range(index.slots)]
+    for view in views:
+        sheet = workbook.create_sheet(view.title())
+        for owner in index.owners(view):
+            grid = index.grid(view, owner)
+            sheet.append([f"{view.title()}: {owner}"])
+            sheet.append(header)
+            for d, day in enumerate(index.days):
+                row = [day]
+                for s in range(index.slots):
+                    records = grid.get((d, s))
+                    if records: row.append("\n".join(label(view, r) for r in records))
+                    else: row.append("RECESS" if s == index.recess else None)
+                sheet.append(row)
+            sheet.append([])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    yield buffer.getvalue()
+
+RENDERERS = {"html": render_html, "csv": render_csv, "xlsx": render_xlsx}
+
+def export(timetable, config, fmt, view="all"):
+    # (media type, chunk iterator) for one format over one view or all three
+    index = TimetableIndex(timetable, config.days, config.slots_per_day, config.recess_index)
+    views = VIEWS if view == "all" else (view,)
+    chunks = RENDERERS[fmt](index, views)
+    if fmt == "xlsx": chunks = iter([next(chunks)])   # surface a missing openpyxl before streaming
+    return FORMATS[fmt], chunks
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+logger = logging.getLogger("TimetableSolver")
+
+# ==========================================
+# BACKGROUND SOLVE JOBS
+# ==========================================
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"   # stopped early; result holds the best schedule found
+
+class Job:
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.status = QUEUED
+        self.progress = {}
+        self.version = 0    # bumped on every progress report
+        self.cancel = threading.Event()
+        self.result = None
+        self.error = None   # HTTPException describing the failure
+        self.details = {}   # extra facts the solve reported: "converged", "metrics", "schedule_id", ...
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.future = None
+
+    def update(self, progress):
+        self.progress = progress
+        self.version += 1
+
+    def report(self, key, value):
+        self.details[key] = value
+
+    def summary(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "progress": self.progress,
+            "error": self.error.detail if self.error else None,
+            "converged": self.details.get("converged"),
+            "metrics": self.details.get("metrics"),
+            "schedule_id": self.details.get("schedule_id"),
+            "feasibility": self.details.get("feasibility"),
+            "note": self.details.get("note"),
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+class JobManager:
+    def __init__(self, max_workers=2, max_jobs=200):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="solver")
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        # fn(*args, progress=callback, cancel=event, report=callback) runs
+        # on the pool; its return value becomes the job result.
+        job = Job()
+        with self.lock:
+            self.jobs[job.id] = job
+            self._evict()
+        job.future = self.executor.submit(self._run, job, fn, args)
+        return job
+
+    def _run(self, job, fn, args):
+        if job.cancel.is_set():
+            job.status = CANCELLED
+            job.finished = time.time()
+            return
+        job.status = RUNNING
+        job.started = time.time()
+        try:
+            job.result = fn(*args, progress=job.update, cancel=job.cancel, report=job.report)
+            job.status = CANCELLED if job.cancel.is_set() else DONE
+        except HTTPException as e:
+            job.error = e
+            job.status = FAILED
+        except Exception as e:
+            logger.exception(f"Job {job.id} failed")
+            job.error = HTTPException(status_code=500, detail=str(e))
+            job.status = FAILED
+        finally:
+            job.finished = time.time()
+
+    def _evict(self):
+        # Drop the oldest finished jobs once the registry is full.
+        for job_id in list(self.jobs):
+            if len(self.jobs) <= self.max_jobs: break
+            if self.jobs[job_id].status in (DONE, FAILED, CANCELLED):
+                del self.jobs[job_id]
+
+    def get(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+        return job
+
+    async def wait(self, job):
+        await asyncio.wrap_future(job.future)
+        if job.status == FAILED: raise job.error
+        return job.result
@@ -1,12 +1,31 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Dict, Any, Optional, Literal
 import random
-import copy
-from collections import defaultdict
-import re
+import math
+import os
+import sys
+import time
+import json
+import asyncio
+import multiprocessing
+import heapq
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait
+from contextlib import nullcontext
+from collections import Counter, defaultdict
 import logging
+import sqlite3
+
+from cache import ResultCache, request_key
+from export import export
+from jobs import JobManager, QUEUED, RUNNING, DONE, FAILED, CANCELLED
+from metrics import MetricsRegistry, SolveMetrics
+from model import compile_model, ROOM_FALLBACK, ROOM_SPECIAL, ROOM_POOL
+from occupancy import Occupancy, TEACHER, DIV_ANY, DIV_ALL, BATCH
+from store import ScheduleStore
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("TimetableSolver")
@@ -19,6 +38,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Response headers the frontend reads (browsers hide the rest cross-origin)
+    expose_headers=["X-Timetable-Converged", "X-Timetable-Note", "X-Schedule-Id", "X-Schedule-Version"],
 )
 
 # ==========================================
@@ -59,6 +80,12 @@ class RoomInput(BaseModel):
     type: str
     special_assignment: Optional[str] = None
 
+class ChangeSet(BaseModel):
+    # Mid-semester changes for a warm-start re-solve (see repair())
+    teachers: List[str] = []    # teacher ids whose classes must be re-placed
+    rooms: List[str] = []       # rooms out of service; never assigned
+    divisions: List[str] = []   # divisions to re-place entirely
+
 class TimetableRequest(BaseModel):
     config: ConfigData
     resources: ResourceData
@@ -70,12 +97,52 @@ class TimetableRequest(BaseModel):
     allocations: List[AllocationData]
     divisions: Dict[str, List[str]]
     rooms: List[RoomInput]
+    seed: Optional[int] = None   # fixes the solver's RNG; same request + seed = same timetable
+    solver: Literal["heuristic", "exact"] = "heuristic"   # "exact": branch and bound first
+    metrics: bool = False   # instrument this solve; totals go to /metrics
+    time_budget_ms: Optional[int] = Field(None, gt=0)   # wall-clock budget; the best schedule so far is returned at the deadline
+    max_runs: Optional[int] = Field(None, ge=1)         # construction restarts (default SOLVER_RUNS)
+    previous: Optional[Dict[str, Dict[str, List[Dict[str, Any]]]]] = None   # timetable to repair instead of solving afresh
+    changes: Optional[ChangeSet] = None
+    alternatives: int = 0   # extra diverse timetables; the body becomes {"timetable", "alternatives"}
+    name: str = "timetable"   # stored as a new version of this schedule name (not part of the cache key)
+    precheck: Literal["warn", "reject", "off"] = "warn"   # "reject": fail fast when check_feasibility finds errors
+
+class ConfigPatch(BaseModel):
+    slots_per_day: Optional[int] = None
+    recess_index: Optional[int] = None
+    days: Optional[List[str]] = None
+
+class Scenario(BaseModel):
+    # One what-if variant of a base request (see run_scenarios())
+    name: str
+    config: Optional[ConfigPatch] = None
+    add_lab_rooms: List[str] = []
+    add_theory_rooms: List[str] = []
+    remove_rooms: List[str] = []     # out of service in this scenario
+    shifts: Dict[str, str] = {}      # teacher id -> shift
+    seed: Optional[int] = None       # default: the base request's seed
+
+class ExportRequest(BaseModel):
+    config: ConfigData
+    timetable: Dict[str, Dict[str, List[Dict[str, Any]]]]   # as returned by /generate-timetable
+
+class ScenarioBatch(BaseModel):
+    base: TimetableRequest
+    scenarios: List[Scenario]
 
 # ==========================================
 # 2. CORE CLASSES
 # ==========================================
 
+# Genes and teachers are slotted: one solve holds thousands of genes, each
+# copied into every parallel worker. Names and types stay strings (interned,
+# so label comparisons are pointer checks); the solver's hot loops work on
+# the integer entity ids and masks the Schedule derives from them.
+
 class Teacher:
+    __slots__ = ("id", "name", "shift", "current_load", "max_load")
+
     def __init__(self, data: FacultyData):
         self.id = data.id
         self.name = data.name
@@ -94,6 +161,8 @@ class Teacher:
     def __repr__(self): return self.name
 
 class DummyTeacher:
+    __slots__ = ("id", "name", "shift", "current_load", "max_load")
+
     def __init__(self, id="-1", name="TBA"):
         self.id = id; self.name = name
         self.current_load = 0; self.max_load = 999; self.shift = "ALL"
@@ -101,389 +170,1749 @@ class DummyTeacher:
     def assign_load(self, duration=1): pass
 
 class Gene:
+    __slots__ = ("div", "type", "subject", "duration", "teachers_list", "lab_subjects", "batch_ids",
+                 "theory", "static", "idx", "enc")
+
     def __init__(self, div, type, subject, duration=1, 
                  teachers_list=None, lab_subjects=None, batch_ids=None):
-        self.div = div
+        self.div = sys.intern(div)
         self.type = type 
-        self.subject = subject 
+        self.subject = sys.intern(subject)
         self.duration = duration
         self.teachers_list = teachers_list if teachers_list else []
         self.lab_subjects = lab_subjects if lab_subjects else [] 
         self.batch_ids = batch_ids if batch_ids else [] 
-        self.day = -1
-        self.slot = -1
-        self.assigned_rooms = []
+        self.theory = type in ("THEORY", "ELECTIVE")   # whole class in theory rooms
+        self.static = None   # ((SLOTS_PER_DAY, RECESS_INDEX), slot-only costs), see score_candidates
+        self.idx = -1   # position in Schedule.genes; placements live in the schedule
+        self.enc = None
 
     def __repr__(self): return f"{self.div}|{self.type}|{self.subject}"
 
+NO_ROOM = ("TBA", "Location TBA")
+
 class Schedule:
-    def __init__(self, genes, constants):
+    def __init__(self, genes, constants, room_index, reserved_rooms=None):
         self.genes = genes
         self.constants = constants
-        self.grid = defaultdict(lambda: defaultdict(lambda: defaultdict(set)))
-        self.div_slots = defaultdict(lambda: defaultdict(list))
-        self.teacher_slots = defaultdict(lambda: defaultdict(list))
-        self.div_batch_busy = defaultdict(lambda: defaultdict(lambda: defaultdict(set)))
-        self.theory_rooms_used = defaultdict(lambda: defaultdict(int))
-        
-        self.div_subjects = defaultdict(lambda: defaultdict(lambda: defaultdict(str)))
-        self.div_type_history = defaultdict(lambda: defaultdict(lambda: defaultdict(str)))
-        self.div_daily_count = defaultdict(lambda: defaultdict(int))
+        # Room name -> room id (ProblemModel.room_index); names outside it
+        # (e.g. "Location TBA") are not tracked. `reserved_rooms` (mask per
+        # week slot) are held by bookings outside this schedule.
+        self.room_index = room_index
+        for i, g in enumerate(genes): g.idx = i
+
+        # Placement state, one entry per gene (-1 / None = unplaced)
+        self.day = [-1] * len(genes)
+        self.slot = [-1] * len(genes)
+        self.rooms = [None] * len(genes)
+        # Booking log (gene idx in booking order) for reset() and snapshot()
+        self.log = []
+
+        slots = constants['SLOTS_PER_DAY']
+        self.occ = Occupancy(constants['NUM_DAYS'], slots)
+        self.recess_mask = 0
+        if 0 <= constants['RECESS_INDEX'] < slots:
+            for d in range(constants['NUM_DAYS']):
+                self.recess_mask |= self.occ.bit(d, constants['RECESS_INDEX'])
+
+        # Division -> running per-day stats kept up to date by book()/unbook():
+        # booked entries per week slot, occupied-slot mask per day, entries per
+        # day (a slot shared by two batches counts twice) and genes per day.
+        # Gaps and sparse days are totalled as rows change.
+        self.div_slot_entries = {}
+        self.div_day_mask = {}
+        self.div_day_entries = {}
+        self.div_daily_count = {}
+        self.total_gaps = 0
+        self.total_sparse = 0
+        # Flat per-(day, slot) tables: index = day * SLOTS_PER_DAY + slot
+        self.theory_rooms_used = [0] * (constants['NUM_DAYS'] * slots)
+        self.room_busy = list(reserved_rooms) if reserved_rooms else [0] * (constants['NUM_DAYS'] * slots)   # mask of busy room ids
+        # Division entity id -> subject / type label per week slot (the most
+        # recent booking covering the slot wins)
+        self.div_subjects = {}
+        self.div_type_history = {}
+        # Division entity id -> genes covering each week slot, in booking order
+        self.occupants = {}
+        # Division entity id -> batch entity ids seen for that division
+        self.div_batches = defaultdict(set)
+
+    def encode(self, gene):
+        # Integer ids of everything a gene occupies, cached on the gene for
+        # as long as it is used with the same entity index.
+        enc = gene.enc
+        if enc is None or enc[0] is not self.occ.index:
+            occ = self.occ
+            slots = self.constants['SLOTS_PER_DAY']
+            teachers = [t for t in gene.teachers_list if t.id != "-1"]
+            shift_mask = 0
+            for t in teachers:
+                for s in range(slots):
+                    if not t.is_available(s, slots): shift_mask |= 1 << s
+            div_any = occ.entity(DIV_ANY, gene.div)
+            batches = [occ.entity(BATCH, (gene.div, b)) for b in gene.batch_ids if b != "ALL"]
+            self.div_batches[div_any].update(batches)
+            enc = gene.enc = (
+                occ.index,
+                div_any,
+                occ.entity(DIV_ALL, gene.div),
+                "ALL" in gene.batch_ids,
+                batches,
+                [occ.entity(TEACHER, t.id) for t in teachers],
+                shift_mask,
+            )
+        return enc
+
+    def labels(self, table, div_id):
+        row = table.get(div_id)
+        if row is None:
+            row = table[div_id] = [None] * len(self.theory_rooms_used)
+        return row
 
     def is_free(self, day, start, gene, strict_repetition_check=True):
-        if start + gene.duration > self.constants['SLOTS_PER_DAY']: return False
+        slots = self.constants['SLOTS_PER_DAY']
+        if start + gene.duration > slots: return False
+        _, div_any, div_all, whole, batches, teachers, shift_mask = self.encode(gene)
         
         if strict_repetition_check:
-            prev_s = start - 1
-            if prev_s == self.constants['RECESS_INDEX']: prev_s -= 1
-            if prev_s >= 0:
-                prev_sub = self.div_subjects[day][prev_s][gene.div]
-                if prev_sub == gene.subject: return False 
-
-            next_s = start + gene.duration
-            if next_s == self.constants['RECESS_INDEX']: next_s += 1
-            if next_s < self.constants['SLOTS_PER_DAY']:
-                next_sub = self.div_subjects[day][next_s][gene.div]
-                if next_sub == gene.subject: return False
-
-        for s in range(start, start + gene.duration):
-            if s == self.constants['RECESS_INDEX']: return False
-            
-            for b in gene.batch_ids:
-                busy_batches = self.div_batch_busy[day][s][gene.div]
-                if "ALL" in busy_batches: return False
-                if b == "ALL":
-                    if len(busy_batches) > 0: return False 
-                elif b in busy_batches:
-                    return False
-
-            for t in gene.teachers_list:
-                if t.id != "-1":
-                    if t.id in self.grid[day][s]['teacher']: return False
-                    if not t.is_available(s, self.constants['SLOTS_PER_DAY']): return False
+            subjects = self.div_subjects.get(div_any)
+            if subjects:
+                base = day * slots
+                prev_s = start - 1
+                if prev_s == self.constants['RECESS_INDEX']: prev_s -= 1
+                if prev_s >= 0 and subjects[base + prev_s] == gene.subject: return False
+
+                next_s = start + gene.duration
+                if next_s == self.constants['RECESS_INDEX']: next_s += 1
+                if next_s < slots and subjects[base + next_s] == gene.subject: return False
+
+        span = self.occ.span(day, start, gene.duration)
+        if span & self.recess_mask: return False
+
+        busy = self.occ.busy
+        if gene.batch_ids:
+            if busy[div_all] & span: return False
+            if whole and busy[div_any] & span: return False
+            for b in batches:
+                if busy[b] & span: return False
+
+        if shift_mask & (((1 << gene.duration) - 1) << start): return False
+        for t in teachers:
+            if busy[t] & span: return False
 
         return True
 
     def book(self, gene, day, start, rooms):
-        gene.day = day
-        gene.slot = start
-        gene.assigned_rooms = rooms
+        i = gene.idx
+        self.day[i] = day
+        self.slot[i] = start
+        self.rooms[i] = rooms
         
-        self.div_daily_count[gene.div][day] += 1
-        
-        for i in range(gene.duration):
-            idx = start + i
-            self.div_subjects[day][idx][gene.div] = gene.subject 
-            self.div_type_history[day][idx][gene.div] = gene.type
-
-            for b in gene.batch_ids:
-                self.div_batch_busy[day][idx][gene.div].add(b)
-            for t in gene.teachers_list:
-                if t.id != "-1":
-                    self.grid[day][idx]['teacher'].add(t.id)
-                    self.teacher_slots[t.id][day].append(idx)
-            for r in rooms:
-                if r != "TBA": self.grid[day][idx]['room'].add(r)
-            self.div_slots[gene.div][day].append(idx)
-            if gene.type in ["THEORY", "ELECTIVE"]:
-                self.theory_rooms_used[day][idx] += len(rooms)
+        self.update_row(gene.div, day, start, gene.duration, 1)
+        _, div_any, div_all, whole, batches, teachers, _ = self.encode(gene)
+        occ = self.occ
+        span = occ.span(day, start, gene.duration)
+
+        if gene.batch_ids:
+            occ.occupy(div_any, span)
+            if whole: occ.occupy(div_all, span)
+            for b in batches: occ.occupy(b, span)
+        for t in teachers: occ.occupy(t, span)
+        self.mark_rooms(rooms, day, start, gene.duration, True)
+
+        subjects = self.labels(self.div_subjects, div_any)
+        types = self.labels(self.div_type_history, div_any)
+        occupants = self.occupants.get(div_any)
+        if occupants is None:
+            occupants = self.occupants[div_any] = [[] for _ in self.theory_rooms_used]
+        lo = day * self.constants['SLOTS_PER_DAY'] + start
+        hi = lo + gene.duration
+        self.log.append(i)
+        subjects[lo:hi] = [gene.subject] * gene.duration
+        types[lo:hi] = [gene.type] * gene.duration
+        for k in range(lo, hi): occupants[k].append(i)
+        if gene.theory:
+            for k in range(lo, hi): self.theory_rooms_used[k] += len(rooms)
+
+    def undo(self):
+        # Reverse the most recent booking.
+        self.unbook(self.genes[self.log[-1]])
+
+    def unbook(self, gene):
+        # Remove any booked gene, in any order.
+        i = gene.idx
+        if self.log[-1] == i: self.log.pop()
+        else: self.log.remove(i)
+        day, start, rooms = self.day[i], self.slot[i], self.rooms[i]
+        self.day[i] = -1
+        self.slot[i] = -1
+        self.rooms[i] = None
+
+        self.update_row(gene.div, day, start, gene.duration, -1)
+        # encode(), not gene.enc: another schedule of the same genes may have
+        # re-encoded them since this booking
+        _, div_any, div_all, whole, batches, teachers, _ = self.encode(gene)
+        occ = self.occ
+        span = occ.span(day, start, gene.duration)
+
+        if gene.batch_ids:
+            if whole: occ.release(div_all, span)
+            for b in batches: occ.release(b, span)
+            # Other batches of the division may still hold these slots
+            still_busy = occ.busy[div_all]
+            for b in self.div_batches[div_any]: still_busy |= occ.busy[b]
+            occ.busy[div_any] = (occ.busy[div_any] & ~span) | (still_busy & span)
+        for t in teachers: occ.release(t, span)
+        self.mark_rooms(rooms, day, start, gene.duration, False)
+
+        lo = day * self.constants['SLOTS_PER_DAY'] + start
+        hi = lo + gene.duration
+        subjects, types = self.div_subjects[div_any], self.div_type_history[div_any]
+        occupants = self.occupants[div_any]
+        for k in range(lo, hi):
+            cell = occupants[k]
+            cell.remove(i)
+            top = self.genes[cell[-1]] if cell else None
+            subjects[k] = top.subject if top else None
+            types[k] = top.type if top else None
+        if gene.theory:
+            for k in range(lo, hi): self.theory_rooms_used[k] -= len(rooms)
+
+    def reset(self):
+        # Unwind every booking: O(placements), no reallocation.
+        while self.log: self.undo()
+
+    def snapshot(self):
+        # Placements in booking order; cheap to keep and replayable via restore()
+        return [(i, self.day[i], self.slot[i], self.rooms[i]) for i in self.log]
+
+    def restore(self, snapshot):
+        self.reset()
+        for i, day, start, rooms in snapshot:
+            self.book(self.genes[i], day, start, rooms)
+
+    def mark_rooms(self, rooms, day, start, duration, busy):
+        mask = 0
+        for r in rooms:
+            rid = self.room_index.get(r)
+            if rid is not None: mask |= 1 << rid
+        if not mask: return
+        lo = day * self.constants['SLOTS_PER_DAY'] + start
+        for k in range(lo, lo + duration):
+            if busy: self.room_busy[k] |= mask
+            else: self.room_busy[k] &= ~mask
+
+    def free_rooms(self, day, start, duration):
+        # Mask of room ids free for the whole span; nothing is free across recess
+        if self.occ.span(day, start, duration) & self.recess_mask: return 0
+        lo = day * self.constants['SLOTS_PER_DAY'] + start
+        busy = 0
+        for k in range(lo, lo + duration): busy |= self.room_busy[k]
+        return ~busy
+
+    def update_row(self, div, day, start, duration, sign):
+        # Add (sign=1) or remove (sign=-1) one gene's slots from a division-day
+        # row and move the gap / sparse totals by the row's change.
+        entries = self.div_slot_entries.get(div)
+        if entries is None:
+            num_days = self.constants['NUM_DAYS']
+            entries = self.div_slot_entries[div] = [0] * len(self.theory_rooms_used)
+            self.div_day_mask[div] = [0] * num_days
+            self.div_day_entries[div] = [0] * num_days
+            self.div_daily_count[div] = [0] * num_days
+        masks, day_entries, daily = self.div_day_mask[div], self.div_day_entries[div], self.div_daily_count[div]
+
+        old_gaps, old_sparse = self.row_stats(div, day)
+        base = day * self.constants['SLOTS_PER_DAY']
+        for s in range(start, start + duration):
+            entries[base + s] += sign
+            if entries[base + s]: masks[day] |= 1 << s
+            else: masks[day] &= ~(1 << s)
+        day_entries[day] += sign * duration
+        daily[day] += sign
+        new_gaps, new_sparse = self.row_stats(div, day)
+        self.total_gaps += new_gaps - old_gaps
+        self.total_sparse += new_sparse - old_sparse
+
+    def row_span(self, div, day):
+        # (first slot, last slot, entries, crosses recess) of a division-day,
+        # or None if nothing is booked there.
+        masks = self.div_day_mask.get(div)
+        if not masks or not masks[day]: return None
+        mask = masks[day]
+        first, last = (mask & -mask).bit_length() - 1, mask.bit_length() - 1
+        return first, last, self.div_day_entries[div][day], first < self.constants['RECESS_INDEX'] < last
+
+    def row_stats(self, div, day):
+        # (gaps, sparse) of one division-day, O(1) from the running stats
+        row = self.row_span(div, day)
+        if row is None: return 0, 0
+        first, last, count, crosses = row
+        gaps = 0
+        if count > 1:
+            span = last - first + 1
+            if crosses: span -= 1
+            diff = span - count
+            if diff > 0: gaps = diff
+        daily_count = self.div_daily_count[div][day]
+        return gaps, 1 if 0 < daily_count < 3 else 0
 
     def calculate_gaps_and_sparse(self):
-        gaps = 0
-        sparse_penalty = 0
-        for div, d_map in self.div_slots.items():
-            for d, slots in d_map.items():
-                slots.sort()
-                valid = [s for s in slots if s != self.constants['RECESS_INDEX']]
-                if len(valid) > 1:
-                    span = valid[-1] - valid[0] + 1
-                    if valid[0] < self.constants['RECESS_INDEX'] < valid[-1]: span -= 1
-                    diff = span - len(valid)
-                    if diff > 0: gaps += diff
-                
-                daily_count = self.div_daily_count[div][d]
-                if 0 < daily_count < 3: 
-                    sparse_penalty += 1
-        return gaps, sparse_penalty
+        return self.total_gaps, self.total_sparse
 
 # ==========================================
 # 3. HELPER FUNCTIONS
 # ==========================================
 
-def normalize_key(s):
-    return re.sub(r'[^a-zA-Z0-9]', '', s).lower().replace('maths', 'math')
+def pick_room(model, pool, rng):
+    # Random room id out of a non-empty room mask
+    names = model.room_names(pool)
+    return model.room_index[rng.choice(names)]
 
-def check_room_free(schedule, day, start, duration, room):
-    for s in range(start, start+duration):
-        if s == schedule.constants['RECESS_INDEX']: return False
-        if room in schedule.grid[day][s]['room']: return False
-    return True
+def get_rooms_for_gene(schedule, day, start, gene, model, rng=random):
+    needed = len(gene.teachers_list)
+    if gene.theory:
+        if schedule.theory_rooms_used[day * schedule.constants['SLOTS_PER_DAY'] + start] + needed > len(model.resources.theory_rooms): return None
+    return pick_rooms(schedule.free_rooms(day, start, gene.duration), gene, model, rng)
 
-def get_rooms_for_gene(schedule, day, start, gene, resources, home_rooms, special_rooms):
+def pick_rooms(free, gene, model, rng):
+    # Rooms for a gene out of `free` (mask of room ids), or None
+    home_rooms = model.home_rooms
     needed = len(gene.teachers_list)
-    found_rooms = []
     
-    if gene.type in ["THEORY", "ELECTIVE"]:
-        if schedule.theory_rooms_used[day][start] + needed > len(resources.theory_rooms): return None
-        pool = list(resources.theory_rooms); random.shuffle(pool)
-        home = home_rooms.get(gene.div)
-        
-        if home and home in pool:
-             if check_room_free(schedule, day, start, gene.duration, home):
-                 pool.remove(home)
-                 pool.insert(0, home)
-
-        for i in range(needed):
-            assigned = None
-            for r in pool:
-                if r not in found_rooms and check_room_free(schedule, day, start, gene.duration, r):
-                    assigned = r; break
-            if assigned: found_rooms.append(assigned)
+    if gene.theory:
+        theory_pool = free & model.theory_mask
+        if theory_pool.bit_count() < needed: return None
+        found_rooms = []
+        home = model.room_index.get(home_rooms.get(gene.div))
+        if needed and home is not None and theory_pool >> home & 1:
+            found_rooms.append(model.rooms[home])
+            theory_pool &= ~(1 << home)
+        found_rooms += rng.sample(model.room_names(theory_pool), needed - len(found_rooms))
+        return found_rooms
             
-    else: 
-        reserved_rooms = {r for rooms in special_rooms.values() for r in rooms}
-        lab_pool = [r for r in resources.lab_rooms if r not in reserved_rooms]
-        random.shuffle(lab_pool)
-        theory_pool = list(resources.theory_rooms); random.shuffle(theory_pool)
+    found_rooms = []
+    for i in range(needed):
+        rule, pool = model.lab_room(gene.lab_subjects[i], gene.type)
         
-        for i in range(needed):
-            sub_name = gene.lab_subjects[i]
-            assigned = None
-            
-            if sub_name == 'PROJECT' or sub_name == 'LIBRARY':
-                for r in theory_pool:
-                     if r not in found_rooms and check_room_free(schedule, day, start, gene.duration, r):
-                        assigned = r; break
-                if not assigned: assigned = "Location TBA"
-            else:
-                norm_sub = normalize_key(sub_name)
-                special_key = next((k for k in special_rooms if normalize_key(k) in norm_sub or norm_sub in normalize_key(k)), None)
-                
-                if special_key:
-                    candidates = special_rooms[special_key]
-                    for r in candidates:
-                        if r not in found_rooms and check_room_free(schedule, day, start, gene.duration, r):
-                            assigned = r; break
-                    if not assigned: return None 
+        pool &= free
+        if rule == ROOM_FALLBACK:
+            if not pool:
+                found_rooms.append("Location TBA"); continue
+            rid = pick_room(model, pool, rng)
+        elif rule == ROOM_SPECIAL:
+            if not pool: return None
+            rid = (pool & -pool).bit_length() - 1   # special rooms are not shuffled
+        else:
+            if not pool: return None
+            rid = pick_room(model, pool, rng)
+        found_rooms.append(model.rooms[rid])
+        free &= ~(1 << rid)
+
+    return found_rooms
+
+def blocked_slots(schedule, gene):
+    # Week slots where the gene's division / batches or teachers are busy
+    _, div_any, div_all, whole, batches, teachers, _ = schedule.encode(gene)
+    busy = schedule.occ.busy
+    blocked = 0
+    if gene.batch_ids:
+        blocked |= busy[div_all]
+        if whole: blocked |= busy[div_any]
+        for b in batches: blocked |= busy[b]
+    for t in teachers: blocked |= busy[t]
+    return blocked
+
+def covered_starts(blocked, duration):
+    # Starts whose span touches a blocked slot
+    covered = blocked
+    for k in range(1, duration): covered |= blocked >> k
+    return covered
+
+def valid_day_starts(gene, shift_mask, S):
+    # Per-day mask of starts that fit in the day and the teachers' shifts
+    day_starts = (1 << (S - gene.duration + 1)) - 1
+    return day_starts & ~covered_starts(shift_mask, gene.duration)
+
+def week_starts(day_starts, S, num_days):
+    week = 0
+    for d in range(num_days): week |= day_starts << (d * S)
+    return week
+
+def score_candidates(schedule, gene, constants, strict_repetition_check=True):
+    # Feasibility and placement cost of every (day, start) of a gene at once.
+    # Feasibility comes from one OR over the occupancy masks of everything the
+    # gene touches; costs are then filled in for feasible starts only, with
+    # the per-day state (gap span, teacher masks, labels) read once per day.
+    # Returns (week bitmask of feasible starts, flat cost list indexed by
+    # day * SLOTS_PER_DAY + start). Feasible starts must agree with is_free.
+    S = constants['SLOTS_PER_DAY']
+    R = constants['RECESS_INDEX']
+    num_days = constants['NUM_DAYS']
+    dur = gene.duration
+    costs = [None] * (num_days * S)
+    if dur > S: return 0, costs
+
+    _, div_any, div_all, whole, batches, teachers, shift_mask = schedule.encode(gene)
+    busy = schedule.occ.busy
+
+    day_starts = valid_day_starts(gene, shift_mask, S)
+    free = week_starts(day_starts, S, num_days) & ~covered_starts(schedule.recess_mask | blocked_slots(schedule, gene), dur)
+
+    # Slot-only terms: gravity, BE mornings, elective / maths-tut placement;
+    # computed once per gene
+    if gene.static is None or gene.static[0] != (S, R):
+        static = []
+        for slot in range(S):
+            cost = slot * 100
+            if "BE" in gene.div and slot >= R: cost += 50000
+            if gene.type == "ELECTIVE":
+                if slot == 0: cost -= 50000 
+                elif slot > 1: cost += 50000 
+            if gene.type == "MATHS_TUT":
+                if slot >= S - 2: cost -= 100000 
+                elif slot <= R: cost += 50000 
+            static.append(cost)
+        gene.static = ((S, R), static)
+    static = gene.static[1]
+
+    subjects = schedule.div_subjects.get(div_any)
+    types = schedule.div_type_history.get(div_any)
+
+    for d in range(num_days):
+        base = d * S
+        starts = (free >> base) & day_starts
+        if not starts: continue
+        current = schedule.row_span(gene.div, d)
+        if current:
+            lo, hi, count = current[0], current[1], current[2] + 1
+        t_days = [busy[t] >> base for t in teachers]
+        div_busy = busy[div_any] >> base
+
+        for slot in range(S - dur + 1):
+            if not starts >> slot & 1: continue
+            prev_s = slot - 1
+            if prev_s == R: prev_s -= 1
+            next_s = slot + dur
+            if next_s == R: next_s += 1
+
+            if strict_repetition_check and subjects:
+                if prev_s >= 0 and subjects[base + prev_s] == gene.subject:
+                    free &= ~(1 << (base + slot)); continue
+                if next_s < S and subjects[base + next_s] == gene.subject:
+                    free &= ~(1 << (base + slot)); continue
+
+            cost = static[slot]
+            for t_busy in t_days:
+                consecutive = 0
+                if prev_s >= 0 and t_busy >> prev_s & 1: consecutive += 1
+                if next_s < S and t_busy >> next_s & 1: consecutive += 1
+                if consecutive >= 1: cost += 1000
+                if consecutive >= 2: cost += 5000
+
+            if current:
+                first, last = min(lo, slot), max(hi, slot)
+                span = last - first + 1
+                if first < R < last: span -= 1
+                actual_gaps = span - count
+                if actual_gaps > 0:
+                    cost += (actual_gaps * 50000000) 
+                    if first < R < last: cost += 200000000 
                 else:
-                    pool_to_use = theory_pool if gene.type == "MATHS_TUT" else lab_pool
-                    for r in pool_to_use:
-                        if r not in found_rooms and check_room_free(schedule, day, start, gene.duration, r):
-                            assigned = r; break
-            
-            if assigned: found_rooms.append(assigned)
+                    cost -= 10000 
 
-    if len(found_rooms) == needed: return found_rooms
-    return None
+            if gene.type == "THEORY" and types:
+                prev1 = prev_s
+                prev2 = prev1 - 1
+                if prev2 == R: prev2 -= 1
+                if prev1 >= 0 and prev2 >= 0:
+                    if types[base + prev1] == "THEORY" and types[base + prev2] == "THEORY":
+                        cost += 5000 
 
-def calculate_cost(schedule, day, slot, gene, constants):
-    cost = 0
-    # 1. GRAVITY
-    cost += slot * 100
-    
-    if "BE" in gene.div and slot >= 4: cost += 50000
+            if gene.type == "LAB" and div_busy >> slot & 1: cost -= 5000 
 
-    for t in gene.teachers_list:
-        if t.id == "-1": continue
-        t_slots = schedule.teacher_slots[t.id][day]
-        prev, next_s = slot - 1, slot + gene.duration
-        if prev == constants['RECESS_INDEX']: prev -= 1
-        if next_s == constants['RECESS_INDEX']: next_s += 1
-        consecutive = 0
-        if prev in t_slots: consecutive += 1
-        if next_s in t_slots: consecutive += 1
-        if consecutive >= 1: cost += 1000
-        if consecutive >= 2: cost += 5000
-
-    # 4. NUCLEAR GAP CHECKER (Aggressive Update)
-    current_slots = schedule.div_slots[gene.div][day]
-    if current_slots:
-        all_s = sorted(current_slots + [slot])
-        
-        # Calculate Span (including the potential new slot)
-        span = all_s[-1] - all_s[0] + 1
-        # Adjust for Recess
-        if all_s[0] < constants['RECESS_INDEX'] < all_s[-1]: 
-            span -= 1 
-            
-        count = len(all_s)
-        actual_gaps = span - count
-        
-        if actual_gaps > 0:
-            # 50 Million points per gap slot. Gap = Enemy #1.
-            cost += (actual_gaps * 50000000) 
-            
-            # The "Commuter Constraint": Spanning recess with a gap is instant death (200M)
-            if all_s[0] < constants['RECESS_INDEX'] and all_s[-1] > constants['RECESS_INDEX']:
-                cost += 200000000 
-        else:
-            # Reward compactness to break ties
-            cost -= 10000 
-
-    if gene.type == "ELECTIVE":
-        if slot == 0: cost -= 50000 
-        elif slot > 1: cost += 50000 
-
-    if gene.type == "MATHS_TUT":
-        if slot >= constants['SLOTS_PER_DAY'] - 2: cost -= 100000 
-        elif slot < 5: cost += 50000 
-
-    if gene.type == "THEORY":
-        prev1 = slot - 1
-        if prev1 == constants['RECESS_INDEX']: prev1 -= 1
-        prev2 = prev1 - 1
-        if prev2 == constants['RECESS_INDEX']: prev2 -= 1
-        if prev1 >= 0 and prev2 >= 0:
-            t1 = schedule.div_type_history[day][prev1][gene.div]
-            t2 = schedule.div_type_history[day][prev2][gene.div]
-            if t1 == "THEORY" and t2 == "THEORY":
-                cost += 5000 
-
-    if gene.type == "LAB":
-        busy_batches = schedule.div_batch_busy[day][slot][gene.div]
-        if busy_batches: cost -= 5000 
-
-    prev_s = slot - 1
-    if prev_s == constants['RECESS_INDEX']: prev_s -= 1
-    if prev_s >= 0:
-        prev_sub = schedule.div_subjects[day][prev_s][gene.div]
-        if prev_sub == gene.subject: cost += 100000
-
-    return cost
-
-def solve(genes, config, resources, home_rooms, special_rooms):
-    logger.info("--- Starting Solver (Zero Gap Aggression) ---")
-    best_sched = None
-    best_score = -float('inf')
-    
-    CONSTANTS = {
-        'SLOTS_PER_DAY': config.slots_per_day,
-        'RECESS_INDEX': 4 
-    }
+            if subjects and prev_s >= 0 and subjects[base + prev_s] == gene.subject:
+                cost += 100000
 
-    random.shuffle(genes) 
-    genes.sort(key=lambda g: 0 if g.type == "LAB" else (1 if g.type == "MATHS_TUT" else (2 if g.type == "ELECTIVE" else 3)))
+            costs[base + slot] = cost
 
-    TOTAL_BATCHES = 3 
+    return free, costs
 
-    for run in range(5000): 
-        schedule = Schedule(copy.deepcopy(genes), CONSTANTS)
-        unplaced = []
-        
-        panic_mode = run > 1500
-        strict_rep = run < 2500
+def solver_constants(config):
+    return {
+        'SLOTS_PER_DAY': config.slots_per_day,
+        'RECESS_INDEX': config.recess_index,
+        'NUM_DAYS': len(config.days)
+    }
 
+def lab_blocks(S, R):
+    # 2-hour lab starts: back-to-back pairs before and after recess
+    # ([0, 2, 5, 7] for 9 slots with recess at 4)
+    if not 0 <= R < S: return list(range(0, S - 1, 2))
+    return list(range(0, R - 1, 2)) + list(range(R + 1, S - 1, 2))
+
+def start_slots(gene, S, R):
+    # Per-day mask of the starts construct() ever tries for this gene; the
+    # slot before recess is kept for theory
+    if gene.duration == 2: slots = lab_blocks(S, R)
+    elif gene.type in ["MATHS_TUT", "ELECTIVE"]: slots = [s for s in range(S) if s != R - 1 and s != R]
+    else: slots = [s for s in range(S) if s != R]
+    mask = 0
+    for s in slots:
+        if s + gene.duration <= S: mask |= 1 << s
+    return mask
+
+class Domains:
+    # Forward checking for construct(). Every gene's static domain (week
+    # bitmask of starts allowed by its shape, teacher shifts, recess and the
+    # start rules) is computed once; during a run the remaining domain drops
+    # the starts blocked by bookings of genes sharing a teacher, division,
+    # batch or special room. Genes are handed out smallest domain first (MRV).
+    def __init__(self, schedule, genes, model):
+        self.schedule = schedule
+        self.genes = genes
+        self.model = model
+        constants = schedule.constants
+        S, num_days = constants['SLOTS_PER_DAY'], constants['NUM_DAYS']
+        self.static = [0] * len(genes)
+        self.watch = defaultdict(list)   # entity id -> idx of genes it can block
+        self.room_watch = []             # (special room mask, gene idx)
         for g in genes:
-            best_move = None
-            min_cost = float('inf')
-            
-            days = list(range(len(config.days))); random.shuffle(days)
-            all_slots = list(range(config.slots_per_day))
-            
-            valid_starts = []
-            
-            if g.duration == 2:
-                hod_blocks = [0, 2, 5, 7] 
-                valid_hod = [s for s in hod_blocks if s + 2 <= config.slots_per_day]
+            _, div_any, div_all, whole, batches, teachers, shift_mask = schedule.encode(g)
+            if g.duration <= S:
+                day_starts = valid_day_starts(g, shift_mask, S) & start_slots(g, S, constants['RECESS_INDEX'])
+                self.static[g.idx] = week_starts(day_starts, S, num_days) & ~covered_starts(schedule.recess_mask, g.duration)
+            blockers = list(teachers)
+            if g.batch_ids:
+                blockers += [div_all] + batches
+                if whole: blockers.append(div_any)
+            for e in blockers: self.watch[e].append(g.idx)
+            if not g.theory:
+                for sub in g.lab_subjects[:len(g.teachers_list)]:
+                    rule, mask = model.lab_room(sub, g.type)
+                    if rule == ROOM_SPECIAL: self.room_watch.append((mask, g.idx))
+
+    def start(self, priority):
+        # New run over an empty schedule; `priority` breaks MRV ties
+        self.priority = priority
+        self.remaining = list(self.static)
+        self.done = [False] * len(self.genes)
+        self.heap = [(self.remaining[g.idx].bit_count(), priority[g.idx], g.idx) for g in self.genes]
+        heapq.heapify(self.heap)
+
+    def next(self):
+        # Unhandled gene with the smallest remaining domain, or None
+        heap = self.heap
+        while heap:
+            size, _, i = heapq.heappop(heap)
+            if self.done[i] or size != self.remaining[i].bit_count(): continue
+            self.done[i] = True
+            return self.genes[i]
+        return None
+
+    def blocks(self, gene):
+        # Gene idx -> week slots newly blocked for it by the booking of
+        # `gene`, for every gene the booking can block. Only the booked span
+        # is checked, so bookings must be undone in reverse order.
+        schedule = self.schedule
+        i = gene.idx
+        day, start, duration = schedule.day[i], schedule.slot[i], gene.duration
+        span = schedule.occ.span(day, start, duration)
+        _, div_any, div_all, whole, batches, teachers, _ = gene.enc
+        touched = list(teachers)
+        if gene.batch_ids:
+            touched += [div_any] + batches
+            if whole: touched.append(div_all)
+        blocked = {j: span for e in touched for j in self.watch.get(e, ())}
+
+        rooms = self.model.room_mask(r for r in schedule.rooms[i] if r in self.model.room_index)
+        if rooms:
+            lo = day * schedule.constants['SLOTS_PER_DAY'] + start
+            for mask, j in self.room_watch:
+                if not mask & rooms: continue
+                for k in range(lo, lo + duration):
+                    if schedule.room_busy[k] & mask == mask: blocked[j] = blocked.get(j, 0) | (1 << k)
+        return blocked
+
+    def booked(self, gene):
+        # Drop the starts the new booking blocks from the domains of the
+        # unhandled genes it can block.
+        for j, slots in self.blocks(gene).items():
+            if self.done[j]: continue
+            domain = self.remaining[j] & ~covered_starts(slots, self.genes[j].duration)
+            if domain != self.remaining[j]:
+                self.remaining[j] = domain
+                heapq.heappush(self.heap, (domain.bit_count(), self.priority[j], j))
+
+def count_rejections(metrics, schedule, gene, free):
+    # Attribute each start construct() would try for the gene but can't use
+    # now (`free` from score_candidates) to one reason: teacher shift, then
+    # teacher clash, then batch / division clash, then repetition.
+    constants = schedule.constants
+    S, num_days, dur = constants['SLOTS_PER_DAY'], constants['NUM_DAYS'], gene.duration
+    if dur > S: return
+    _, div_any, div_all, whole, batches, teachers, shift_mask = schedule.encode(gene)
+    busy = schedule.occ.busy
+    fits = ((1 << (S - dur + 1)) - 1) & start_slots(gene, S, constants['RECESS_INDEX'])
+    starts = week_starts(fits, S, num_days) & ~covered_starts(schedule.recess_mask, dur)
+    left = starts & week_starts(valid_day_starts(gene, shift_mask, S), S, num_days)
+    shift = starts & ~left
+    teacher_busy = 0
+    for t in teachers: teacher_busy |= busy[t]
+    teacher = left & covered_starts(teacher_busy, dur)
+    left &= ~teacher
+    batch = left & covered_starts(blocked_slots(schedule, gene) & ~teacher_busy, dur)
+    left &= ~batch
+    counters = metrics.counters
+    counters["shift"] += shift.bit_count()
+    counters["teacher_clash"] += teacher.bit_count()
+    counters["batch_clash"] += batch.bit_count()
+    counters["repetition"] += (left & ~free).bit_count()
+
+def best_possible(unplaced_count):
+    # Upper bound on score_schedule() for a run with this many genes unplaced
+    return 1000000 - unplaced_count * UNPLACED_WEIGHT
+
+def construct(schedule, genes, model, stage, rng, domains=None, bound=None, metrics=None):
+    # One randomized greedy construction from an empty schedule. `stage` is
+    # the share of the solve budget used so far (see Budget.stage).
+    # Returns the genes that could not be placed. With `domains` genes are
+    # taken most constrained first and a gene whose domain ran empty is
+    # unplaced without a scan; once the unplaced count alone keeps the run
+    # from beating `bound` (best score so far) the rest is given up.
+    schedule.reset()
+    config = model.config
+    constants = schedule.constants
+    unplaced = []
+    TOTAL_BATCHES = 3 
+    
+    S, recess = config.slots_per_day, constants['RECESS_INDEX']
+    panic_mode = stage > PANIC_AFTER
+    strict_rep = stage < STRICT_REPETITION_UNTIL
+
+    if domains: domains.start({g.idx: k for k, g in enumerate(genes)})
+    order = iter(genes)
+
+    while True:
+        g = domains.next() if domains else next(order, None)
+        if g is None: break
+        if bound is not None and best_possible(len(unplaced)) <= bound:
+            return [g for g in genes if schedule.day[g.idx] == -1]
+        if domains and not domains.remaining[g.idx]:
+            unplaced.append(g); continue
+        best_move = None
+        min_cost = float('inf')
+        
+        days = list(range(len(config.days))); rng.shuffle(days)
+        all_slots = list(range(config.slots_per_day))
+        
+        valid_starts = []
+        
+        if g.duration == 2:
+            valid_hod = lab_blocks(config.slots_per_day, recess)
 
-                if len(g.batch_ids) < TOTAL_BATCHES:
-                    valid_starts = sorted(valid_hod, key=lambda x: -x) 
-                else:
-                    random.shuffle(valid_hod)
-                    valid_starts = valid_hod
-
-            elif g.type == "MATHS_TUT":
-                late = [7, 8, 6]; random.shuffle(late)
-                others = [s for s in all_slots if s not in late and s != 3 and s != 4]
-                random.shuffle(others)
-                valid_starts = late + others
-            elif g.type == "ELECTIVE":
-                early = [0, 1]
-                others = [s for s in all_slots if s not in early and s != 3 and s != 4]
-                random.shuffle(others)
-                valid_starts = early + others
-            else:
-                gap_filler = [3]
-                others = [s for s in all_slots if s != 3 and s != 4]
-                random.shuffle(others)
-                valid_starts = gap_filler + others
-
-            for d in days:
-                for s in valid_starts:
-                    if schedule.is_free(d, s, g, strict_repetition_check=strict_rep):
-                        rooms = get_rooms_for_gene(schedule, d, s, g, resources, home_rooms, special_rooms)
-                        if rooms:
-                            cost = calculate_cost(schedule, d, s, g, CONSTANTS)
-                            if cost < min_cost:
-                                min_cost = cost
-                                best_move = (d, s, rooms)
-                                if panic_mode: break 
-                                if cost <= -100000: break 
-                if best_move and (panic_mode or min_cost <= -100000): break
-            
-            if best_move:
-                schedule.book(g, best_move[0], best_move[1], best_move[2])
+            if len(g.batch_ids) < TOTAL_BATCHES:
+                valid_starts = sorted(valid_hod, key=lambda x: -x) 
             else:
-                unplaced.append(g)
-        
-        score = 1000000
-        score -= (len(unplaced) * 100000000) 
+                rng.shuffle(valid_hod)
+                valid_starts = valid_hod
+
+        elif g.type == "MATHS_TUT":
+            late = [s for s in (S - 2, S - 1, S - 3) if 0 <= s and s != recess - 1 and s != recess]; rng.shuffle(late)
+            others = [s for s in all_slots if s not in late and s != recess - 1 and s != recess]
+            rng.shuffle(others)
+            valid_starts = late + others
+        elif g.type == "ELECTIVE":
+            early = [s for s in (0, 1) if s < S and s != recess - 1 and s != recess]
+            others = [s for s in all_slots if s not in early and s != recess - 1 and s != recess]
+            rng.shuffle(others)
+            valid_starts = early + others
+        else:
+            gap_filler = [recess - 1] if 0 <= recess - 1 < config.slots_per_day else []
+            others = [s for s in all_slots if s != recess - 1 and s != recess]
+            rng.shuffle(others)
+            valid_starts = gap_filler + others
+
+        if metrics:
+            with metrics.phase("scoring"): free, costs = score_candidates(schedule, g, constants, strict_rep)
+            count_rejections(metrics, schedule, g, free)
+        else:
+            free, costs = score_candidates(schedule, g, constants, strict_rep)
+        for d in days:
+            base = d * config.slots_per_day
+            for s in valid_starts:
+                if s + g.duration <= config.slots_per_day and free >> (base + s) & 1:
+                    rooms = get_rooms_for_gene(schedule, d, s, g, model, rng)
+                    if metrics and not rooms: metrics.counters["room_shortage"] += 1
+                    if rooms:
+                        cost = costs[base + s]
+                        if cost < min_cost:
+                            min_cost = cost
+                            best_move = (d, s, rooms)
+                            if panic_mode: break 
+                            if cost <= -100000: break 
+            if best_move and (panic_mode or min_cost <= -100000): break
         
-        gaps, sparse_days = schedule.calculate_gaps_and_sparse()
-        score -= (gaps * 50000000) # Increased to match cost logic
-        score -= (sparse_days * 300000) 
+        if best_move:
+            schedule.book(g, best_move[0], best_move[1], best_move[2])
+            if domains: domains.booked(g)
+        else:
+            unplaced.append(g)
+    return unplaced
+
+UNPLACED_WEIGHT = 100000000
+GAP_WEIGHT = 50000000 # Increased to match cost logic
+SPARSE_WEIGHT = 300000
+
+def score_schedule(schedule, unplaced):
+    score = 1000000
+    score -= (len(unplaced) * UNPLACED_WEIGHT) 
+    
+    gaps, sparse_days = schedule.calculate_gaps_and_sparse()
+    score -= (gaps * GAP_WEIGHT)
+    score -= (sparse_days * SPARSE_WEIGHT) 
+    return score, gaps, sparse_days
+
+def is_converged(unplaced, gaps, sparse_days, min_unplaced=0):
+    # min_unplaced > 0 when the exact search proved that many genes can't all fit
+    return len(unplaced) <= min_unplaced and gaps <= 3 and sparse_days == 0
+
+# Progress counters shared with parallel workers: best (score, unplaced,
+# gaps, sparse days) so far plus the number of finished runs.
+BEST_SCORE, BEST_UNPLACED, BEST_GAPS, BEST_SPARSE, RUNS_DONE = range(5)
+
+def progress_info(stats, started, runs_total):
+    return {
+        "runs_done": stats[RUNS_DONE], "runs_total": runs_total,
+        "best_score": stats[BEST_SCORE], "unplaced": stats[BEST_UNPLACED],
+        "gaps": stats[BEST_GAPS], "sparse_days": stats[BEST_SPARSE],
+        "elapsed": round(time.monotonic() - started, 3),
+    }
+
+# --- ALTERNATIVES ---
+# Besides the best schedule a solve can keep the K best complete ones that
+# differ enough to be worth offering as alternatives.
+
+MAX_ALTERNATIVES = 5
+ALTERNATIVE_DISTANCE = 0.1   # share of genes an alternative must place elsewhere
+POOL_PATIENCE = 200          # runs a full pool may go without change before the search stops
+
+class SchedulePool:
+    # Best complete schedules seen, pairwise at least min_distance apart in
+    # Hamming distance over gene -> (day, slot). Interchangeable genes (same
+    # division, subject, teachers and batches) are compared as a sorted
+    # group, so swapping two of them is no difference.
+    def __init__(self, genes, size, min_distance=None):
+        groups = defaultdict(list)
+        for g in genes:
+            key = (g.div, g.type, g.subject, tuple(t.id for t in g.teachers_list), tuple(g.lab_subjects), tuple(g.batch_ids))
+            groups[key].append(g)
+        self.groups = list(groups.values())
+        self.size = size
+        if min_distance is None: min_distance = max(1, math.ceil(ALTERNATIVE_DISTANCE * len(genes)))
+        self.min_distance = min_distance
+        self.entries = []     # (score, placement, snapshot, converged), best first
+        self.idle = 0         # runs since the pool last changed
+        self.schedules = []   # alternatives after local search, see polish_alternatives()
+
+    def placement(self, schedule):
+        S = schedule.constants['SLOTS_PER_DAY']
+        return tuple(k for group in self.groups
+                     for k in sorted(schedule.day[g.idx] * S + schedule.slot[g.idx] for g in group))
+
+    def distance(self, a, b):
+        return sum(1 for x, y in zip(a, b) if x != y)
+
+    def bound(self):
+        # Score a run has to beat to get in, None while there is room
+        return self.entries[-1][0] if len(self.entries) == self.size else None
+
+    def offer(self, score, schedule, converged):
+        self.idle += 1
+        bound = self.bound()
+        if bound is None or score > bound:
+            self.add((score, self.placement(schedule), schedule.snapshot(), converged))
+
+    def add(self, entry):
+        # A schedule too close to pooled ones replaces them only if better
+        # than all of them
+        near = [e for e in self.entries if self.distance(e[1], entry[1]) < self.min_distance]
+        if any(e[0] >= entry[0] for e in near): return
+        self.entries = [e for e in self.entries if not any(e is n for n in near)] + [entry]
+        self.entries.sort(key=lambda e: -e[0])
+        del self.entries[self.size:]
+        self.idle = 0
+
+    def done(self):
+        # Full, and either all converged or no longer improving; local search
+        # polishes the alternatives afterwards anyway
+        if len(self.entries) < self.size: return False
+        return all(e[3] for e in self.entries) or self.idle >= POOL_PATIENCE
+
+def polish_alternatives(pool, best, first, genes, model, rng, cancel=None, deadline=None):
+    # Local search on every pooled schedule but the one `best` grew from
+    # (`first` = its placement before local search); keep those still
+    # min_distance away from the best and from each other.
+    kept = [pool.placement(best)]
+    schedules = []
+    for score, placement, snapshot, _ in pool.entries:
+        if len(schedules) == pool.size - 1: break
+        if placement == first: continue
+        schedule = Schedule(genes, solver_constants(model.config), model.room_index, model.reserved_rooms)
+        schedule.restore(snapshot)
+        improve(schedule, model, rng, cancel=cancel, deadline=deadline)
+        placement = pool.placement(schedule)
+        if any(pool.distance(placement, p) < pool.min_distance for p in kept): continue
+        kept.append(placement)
+        schedules.append(schedule)
+    return schedules
+
+def search(genes, model, runs, rng, shared=None,
+           progress=None, cancel=None, min_unplaced=0, metrics=None, budget=None, pool=None):
+    # Best-of-N restarts over the given run indices. `shared` is an optional
+    # (stats Array, stop Event) pair used to coordinate parallel workers;
+    # `progress` gets progress_info() at most every PROGRESS_INTERVAL seconds
+    # and `cancel` is an Event that stops the search with the best so far.
+    # `budget` sets the strategy stage and stops the search at its deadline.
+    # With a SchedulePool complete runs are offered to it too, and the search
+    # goes on until the pool is full of converged schedules as well.
+    schedule = Schedule(genes, solver_constants(model.config), model.room_index, model.reserved_rooms)
+    domains = Domains(schedule, genes, model)
+    best_snapshot = None
+    best_score = -float('inf')
+    best_converged = False
+    stats = shared[0] if shared else [-(2 ** 62), -1, -1, -1, 0]
+    budget = budget or Budget()
+    started = last_report = time.monotonic()
+
+    for run in runs:
+        if shared and shared[1].is_set(): break
+        if cancel is not None and cancel.is_set(): break
+        if best_snapshot is not None and budget.search_expired(): break
+        bound = max(best_score, stats[BEST_SCORE]) if pool is None else pool.bound()
+        stage = budget.stage(run)
+        if metrics:
+            with metrics.phase("construction"):
+                unplaced = construct(schedule, genes, model, stage, rng, domains, bound, metrics)
+            metrics.runs += 1
+        else:
+            unplaced = construct(schedule, genes, model, stage, rng, domains, bound)
+        score, gaps, sparse_days = score_schedule(schedule, unplaced)
         
         if run % 500 == 0: 
             logger.info(f"Run {run}: Score={score} Unplaced={len(unplaced)} Gaps={gaps} Sparse={sparse_days}")
+
+        if shared:
+            with stats.get_lock():
+                stats[RUNS_DONE] += 1
+                if score > stats[BEST_SCORE]:
+                    stats[BEST_SCORE:RUNS_DONE] = [score, len(unplaced), gaps, sparse_days]
+        else:
+            stats[RUNS_DONE] += 1
+            if score > stats[BEST_SCORE]:
+                stats[BEST_SCORE:RUNS_DONE] = [score, len(unplaced), gaps, sparse_days]
+            if progress and time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                last_report = time.monotonic()
+                progress(progress_info(stats, started, budget.max_runs))
         
         if score > best_score:
             best_score = score
-            best_sched = schedule
-            if len(unplaced) == 0 and gaps <= 3 and sparse_days == 0: 
+            best_snapshot = schedule.snapshot()
+            if metrics: metrics.runs_to_best = metrics.runs
+            best_converged = is_converged(unplaced, gaps, sparse_days, min_unplaced)
+        if pool is not None and not unplaced: pool.offer(score, schedule, is_converged(unplaced, gaps, sparse_days))
+        if best_converged and (pool is None or pool.done()):
+            if shared: shared[1].set()
+            break
+
+    if progress: progress(progress_info(stats, started, budget.max_runs))
+    return best_score, best_snapshot
+
+# --- PARALLEL MULTI-START ---
+# Restarts are independent, so they are dealt round-robin to worker processes
+# (keeping the run-index based strategy switches intact). Workers share the
+# best score and a stop event so everyone quits once one run converges.
+
+SOLVER_RUNS = 5000
+# SOLVER_WORKERS=1 (default) keeps the serial solver, 0 means one worker per core
+SOLVER_WORKERS = int(os.environ.get("SOLVER_WORKERS", "1")) or (os.cpu_count() or 1)
+# Minimum seconds between progress reports (serial runs / parallel polling)
+PROGRESS_INTERVAL = 0.25
+
+# Strategy switches, as shares of the solve budget (runs or wall clock)
+PANIC_AFTER = 0.3               # then take the first acceptable start per gene
+STRICT_REPETITION_UNTIL = 0.5   # until then no back-to-back repeats of a subject
+LOCAL_SEARCH_SHARE = 0.1        # of a wall-clock budget, kept for local search
+EXACT_SHARE = 0.5               # of a wall-clock budget the exact search may use
+
+class Budget:
+    # Run cap and optional wall-clock budget of one solve. Construction stops
+    # at search_deadline; local search may run on until deadline.
+    def __init__(self, max_runs=None, time_budget_ms=None):
+        self.max_runs = SOLVER_RUNS if max_runs is None else max_runs
+        self.seconds = time_budget_ms / 1000 if time_budget_ms else None
+        self.deadline = self.search_deadline = None
+        if self.seconds:
+            now = time.time()
+            self.deadline = now + self.seconds
+            self.search_deadline = now + self.seconds * (1 - LOCAL_SEARCH_SHARE)
+
+    def stage(self, run):
+        # Share of the budget used: by runs, or by time if that is further along
+        stage = run / self.max_runs
+        if self.seconds:
+            used = 1 - (self.search_deadline - time.time()) / (self.seconds * (1 - LOCAL_SEARCH_SHARE))
+            stage = max(stage, used)
+        return stage
+
+    def search_expired(self):
+        return self.search_deadline is not None and time.time() >= self.search_deadline
+
+    def expired(self):
+        return self.deadline is not None and time.time() >= self.deadline
+
+    def remaining(self):
+        return None if self.deadline is None else max(0.0, self.deadline - time.time())
+
+    def share(self, fraction):
+        # Budget for one part of a solve: same run cap, `fraction` of the time left
+        remaining = self.remaining()
+        return Budget(self.max_runs, None if remaining is None else max(1, int(remaining * fraction * 1000)))
+
+_shared = None
+
+def _init_worker(stats, stop):
+    global _shared
+    _shared = (stats, stop)
+
+def _search_worker(genes, model, runs, seed, min_unplaced, instrument, budget, pool_size):
+    metrics = SolveMetrics() if instrument else None
+    pool = SchedulePool(genes, *pool_size) if pool_size else None
+    score, snapshot = search(genes, model, runs, random.Random(seed), _shared, min_unplaced=min_unplaced,
+                             metrics=metrics, budget=budget, pool=pool)
+    return score, snapshot, metrics.as_dict() if metrics else None, pool.entries if pool else None
+
+def search_parallel(genes, model, workers, rng,
+                    progress=None, cancel=None, min_unplaced=0, metrics=None, budget=None, pool=None):
+    budget = budget or Budget()
+    pool_size = (pool.size, pool.min_distance) if pool is not None else None
+    started = time.monotonic()
+    # Spawned, not forked: a forked child would copy the server's threads and
+    # any lock one of them holds (job runner, stores, logging)
+    ctx = multiprocessing.get_context("spawn")
+    stats = ctx.Array('q', [-(2 ** 62), -1, -1, -1, 0])
+    stop = ctx.Event()
+    base_seed = rng.randrange(2 ** 32)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                             initializer=_init_worker, initargs=(stats, stop)) as executor:
+        futures = [
+            executor.submit(_search_worker, genes, model, range(k, budget.max_runs, workers), base_seed + k,
+                        min_unplaced, metrics is not None, budget, pool_size)
+            for k in range(workers)
+        ]
+        pending = futures
+        while pending:
+            _, pending = wait(pending, timeout=PROGRESS_INTERVAL)
+            if cancel is not None and cancel.is_set(): stop.set()
+            if progress:
+                with stats.get_lock(): info = progress_info(stats, started, budget.max_runs)
+                progress(info)
+        results = [f.result() for f in futures]
+    best = max(results, key=lambda r: r[0])
+    if pool is not None:
+        for r in results:
+            for entry in r[3]: pool.add(entry)
+    if metrics:
+        for r in results: metrics.merge(r[2])
+        metrics.runs_to_best = best[2]["runs_to_best"]   # within the winning worker
+    return best[0], best[1]
+
+# --- LOCAL SEARCH ---
+# Simulated annealing on the best constructed schedule. Moves: relocate a
+# gene (or place an unplaced one), swap two same-length genes of a division,
+# and a Kempe-style exchange that moves a gene to another block and the
+# division's genes in that block back into its old one. Each move is scored
+# from the division-day rows it touches only.
+
+LOCAL_SEARCH_ITERATIONS = int(os.environ.get("LOCAL_SEARCH_ITERATIONS", "3000"))
+REPEAT_WEIGHT = 100000   # same subject in back-to-back slots (soft)
+
+def row_repeats(schedule, div, day):
+    div_any = schedule.occ.index.get((DIV_ANY, div))
+    occupants = schedule.occupants.get(div_any)
+    if not occupants: return 0
+    S, R = schedule.constants['SLOTS_PER_DAY'], schedule.constants['RECESS_INDEX']
+    base = day * S
+    repeats = 0
+    prev = None
+    for slot in range(S):
+        if slot == R: continue
+        cell = occupants[base + slot]
+        top = cell[-1] if cell else None
+        if top is not None and prev is not None and top != prev:
+            if schedule.genes[top].subject == schedule.genes[prev].subject: repeats += 1
+        prev = top
+    return repeats
+
+def row_penalty(schedule, div, day):
+    # (hard, soft) penalty of one division-day row
+    gaps, sparse = schedule.row_stats(div, day)
+    return gaps * GAP_WEIGHT + sparse * SPARSE_WEIGHT, row_repeats(schedule, div, day) * REPEAT_WEIGHT
+
+def place(schedule, gene, day, start, model, rng):
+    # Book gene at (day, start) if it is free there and rooms can be found.
+    if start + gene.duration > schedule.constants['SLOTS_PER_DAY']: return False
+    if not schedule.is_free(day, start, gene): return False
+    rooms = get_rooms_for_gene(schedule, day, start, gene, model, rng)
+    if not rooms: return False
+    schedule.book(gene, day, start, rooms)
+    return True
+
+def improve(schedule, model, rng, iterations=None, cancel=None, deadline=None, movable=None):
+    # `movable` (gene idx set) restricts the moves to those genes; the rest
+    # stay where they are.
+    iterations = LOCAL_SEARCH_ITERATIONS if iterations is None else iterations
+    constants = schedule.constants
+    S, R, num_days = constants['SLOTS_PER_DAY'], constants['RECESS_INDEX'], constants['NUM_DAYS']
+    genes = schedule.genes
+    # Moves keep to the starts construct() allows each gene (start_slots)
+    allowed = [week_starts(start_slots(g, S, R), S, num_days) for g in genes]
+    allowed_starts = [[k for k in range(num_days * S) if mask >> k & 1] for mask in allowed]
+    movable = sorted(movable) if movable is not None else range(len(genes))
+    can_move = set(movable)
+    by_div = defaultdict(list)
+    for g in genes: by_div[g.div].append(g)
+
+    def placement(g):
+        i = g.idx
+        return (schedule.day[i], schedule.slot[i], schedule.rooms[i])
+
+    def penalty(rows, unplaced_count):
+        hard, soft = unplaced_count * UNPLACED_WEIGHT, 0
+        for div, day in rows:
+            h, s_ = row_penalty(schedule, div, day)
+            hard += h; soft += s_
+        return hard, soft
+
+    all_rows = [(div, d) for div in by_div for d in range(num_days)]
+    unplaced = {g.idx for g in genes if schedule.day[g.idx] == -1}
+    hard, soft = penalty(all_rows, len(unplaced))
+    if hard == 0 and soft == 0: return
+    best_key = (hard, soft)
+    best_snapshot = schedule.snapshot()
+    start_hard = hard
+
+    def random_start(g):
+        free, _ = score_candidates(schedule, g, constants)
+        free &= allowed[g.idx]
+        starts = [k for k in range(num_days * S) if free >> k & 1]
+        return divmod(rng.choice(starts), S) if starts else None
+
+    def try_move(moved, targets):
+        # Unbook `moved`, book them at `targets` (None = leave unplaced) in
+        # order. Returns the old placements, or None after rolling back.
+        old = [placement(g) for g in moved]
+        for g, (d, s_, _) in zip(moved, old):
+            if d != -1: schedule.unbook(g)
+        done = []
+        for g, target in zip(moved, targets):
+            if target is None: continue
+            if not place(schedule, g, target[0], target[1], model, rng): break
+            done.append(g)
+        else:
+            return old
+        for g in done: schedule.unbook(g)
+        for g, (d, s_, rooms) in zip(moved, old):
+            if d != -1: schedule.book(g, d, s_, rooms)
+        return None
+
+    temperature = T0 = float(SPARSE_WEIGHT)
+    cooling = (1000.0 / T0) ** (1.0 / max(iterations, 1))
+
+    for it in range(iterations):
+        if it % 100 == 0:
+            if cancel is not None and cancel.is_set(): break
+            if deadline is not None and time.time() >= deadline: break
+        temperature *= cooling
+        roll = rng.random()
+
+        if unplaced and roll < 0.2:
+            g = genes[rng.choice(list(unplaced))]
+            target = random_start(g)
+            if target is None: continue
+            moved, targets = [g], [target]
+        else:
+            placed = [k for k in movable if schedule.day[k] != -1]
+            if not placed: break
+            g = genes[rng.choice(placed)]
+            d1, s1, _ = placement(g)
+            if roll < 0.6:
+                target = random_start(g)
+                if target is None: continue
+                moved, targets = [g], [target]
+            elif roll < 0.8:
+                partners = [h for h in by_div[g.div] if h is not g and h.duration == g.duration and h.idx in can_move
+                            and schedule.day[h.idx] != -1 and placement(h)[:2] != (d1, s1)]
+                if not partners: continue
+                h = rng.choice(partners)
+                moved, targets = [g, h], [placement(h)[:2], (d1, s1)]
+            else:
+                if not allowed_starts[g.idx]: continue
+                d2, s2 = divmod(rng.choice(allowed_starts[g.idx]), S)
+                if (d2, s2) == (d1, s1): continue
+                lo, hi = s2, s2 + g.duration
+                chain = [h for h in by_div[g.div] if h is not g and schedule.day[h.idx] == d2
+                         and schedule.slot[h.idx] < hi and schedule.slot[h.idx] + h.duration > lo]
+                if any(schedule.slot[h.idx] < lo or schedule.slot[h.idx] + h.duration > hi for h in chain): continue
+                if any(h.idx not in can_move for h in chain): continue
+                moved = [g] + chain
+                targets = [(d2, s2)] + [(d1, s1 + schedule.slot[h.idx] - s2) for h in chain]
+
+        if any(t is not None and not allowed[h.idx] >> (t[0] * S + t[1]) & 1 for h, t in zip(moved, targets)): continue
+
+        rows = {(h.div, d) for h in moved for d in (schedule.day[h.idx], ) if d != -1}
+        rows |= {(h.div, t[0]) for h, t in zip(moved, targets) if t is not None}
+        before = penalty(rows, len(unplaced))
+        old = try_move(moved, targets)
+        if old is None: continue
+        new_unplaced = unplaced - {h.idx for h in moved}
+        after = penalty(rows, len(new_unplaced))
+        delta = (after[0] + after[1]) - (before[0] + before[1])
+
+        if delta <= 0 or rng.random() < math.exp(-delta / temperature):
+            unplaced = new_unplaced
+            hard += after[0] - before[0]
+            soft += after[1] - before[1]
+            if (hard, soft) < best_key:
+                best_key = (hard, soft)
+                best_snapshot = schedule.snapshot()
+                if best_key == (0, 0): break
+        else:
+            for h in moved: schedule.unbook(h)
+            for h, (d, s_, rooms) in zip(moved, old):
+                if d != -1: schedule.book(h, d, s_, rooms)
+
+    schedule.restore(best_snapshot)
+    logger.info(f"Local search: penalty {start_hard} -> {best_key[0]} (soft {best_key[1]})")
+
+# --- WARM-START REPAIR ---
+# Re-solve after a mid-semester change starting from the previous timetable.
+# Every booking the change doesn't touch is pinned where it was; touched
+# genes (changed allocations, listed teachers / divisions, bookings that no
+# longer fit) are re-placed, evicting as few pinned bookings of the same
+# division or teachers as possible, and local search then tidies only the
+# genes that moved. A booking that only lost its room (or was evicted) gets
+# its old start back with new rooms whenever that start is still free.
+
+REPAIR_ITERATIONS = int(os.environ.get("REPAIR_ITERATIONS", "1000"))
+
+def previous_placements(genes, model, previous):
+    # Gene idx -> (day, start, rooms) of its entry in `previous`, a
+    # format_output() timetable. Genes are matched on entry_key(); identical
+    # genes (theory load units) take the identical entries in turn.
+    day_index = {name: d for d, name in enumerate(model.config.days)}
+    entries = defaultdict(list)
+    for div, days in previous.items():
+        for day_name, day_entries in days.items():
+            d = day_index.get(day_name)
+            if d is None: continue
+            for e in day_entries:
+                if isinstance(e.get("slot"), int): entries[entry_key(div, e)].append((d, e["slot"], entry_rooms(e)))
+    placements = {}
+    for g in genes:
+        found = entries.get(entry_key(g.div, format_entry(g, -1, ["TBA"] * len(g.teachers_list))))
+        if found: placements[g.idx] = found.pop(0)
+    return placements
+
+def rooms_fit(schedule, model, gene, day, start, rooms):
+    # Are `rooms` still valid for the gene at (day, start): free, in service
+    # and allowed by its room rule
+    if len(rooms) != len(gene.teachers_list): return False
+    free = schedule.free_rooms(day, start, gene.duration)
+    for i, name in enumerate(rooms):
+        if gene.theory: rule, pool = ROOM_POOL, model.theory_mask
+        else: rule, pool = model.lab_room(gene.lab_subjects[i], gene.type)
+        if name in NO_ROOM:
+            if rule != ROOM_FALLBACK: return False
+            continue
+        rid = model.room_index.get(name)
+        if rid is None or not (pool & free) >> rid & 1: return False
+        free &= ~(1 << rid)
+    return True
+
+def clashes(a, b):
+    # Can't share a slot: common teacher, or same division with overlapping batches
+    if {t.id for t in a.teachers_list if t.id != "-1"} & {t.id for t in b.teachers_list}: return True
+    if a.div != b.div: return False
+    return "ALL" in a.batch_ids or "ALL" in b.batch_ids or bool(set(a.batch_ids) & set(b.batch_ids))
+
+def relocate(schedule, gene, model, rng, pinned, neighbours, home=None):
+    # Book an unplaced gene at its `home` (day, start) with fresh rooms, else
+    # at its cheapest free start; failing that at the start that evicts the
+    # fewest pinned bookings. Returns the evicted genes, or None if the gene
+    # stays unplaced.
+    constants = schedule.constants
+    S, R, num_days = constants['SLOTS_PER_DAY'], constants['RECESS_INDEX'], constants['NUM_DAYS']
+    if home is not None:
+        day, start = home
+        if 0 <= day < num_days and 0 <= start <= S - gene.duration \
+                and schedule.is_free(day, start, gene, strict_repetition_check=False):
+            rooms = get_rooms_for_gene(schedule, day, start, gene, model, rng)
+            if rooms:
+                schedule.book(gene, day, start, rooms)
+                return []
+    free, costs = score_candidates(schedule, gene, constants, strict_repetition_check=False)
+    free &= week_starts(start_slots(gene, S, R), S, num_days)
+    for k in sorted((k for k in range(num_days * S) if free >> k & 1), key=lambda k: costs[k]):
+        if place(schedule, gene, k // S, k % S, model, rng): return []
+
+    allowed = week_starts(valid_day_starts(gene, schedule.encode(gene)[6], S) & start_slots(gene, S, R), S, num_days)
+    allowed &= ~covered_starts(schedule.recess_mask, gene.duration)
+    best = None
+    for k in range(num_days * S):
+        if not allowed >> k & 1: continue
+        day, start = divmod(k, S)
+        blockers = [h for h in neighbours if schedule.day[h.idx] == day
+                    and schedule.slot[h.idx] < start + gene.duration and start < schedule.slot[h.idx] + h.duration]
+        if not blockers or any(h.idx not in pinned for h in blockers): continue
+        if best is not None and len(blockers) >= len(best[2]): continue
+        old = [(h, schedule.day[h.idx], schedule.slot[h.idx], schedule.rooms[h.idx]) for h in blockers]
+        for h in blockers: schedule.unbook(h)
+        if place(schedule, gene, day, start, model, rng):
+            best = (day, start, blockers)
+            schedule.unbook(gene)
+        for h, d, s_, rooms in old: schedule.book(h, d, s_, rooms)
+    if best is None: return None
+
+    day, start, blockers = best
+    for h in blockers: schedule.unbook(h)
+    if not place(schedule, gene, day, start, model, rng):
+        return None   # rooms went to a random pick last time; leave it unplaced
+    return blockers
+
+def repair(genes, model, previous, changes, rng, cancel=None, deadline=None):
+    schedule = Schedule(genes, solver_constants(model.config), model.room_index, model.reserved_rooms)
+    S = schedule.constants['SLOTS_PER_DAY']
+    placements = previous_placements(genes, model, previous)
+    teachers = set(changes.teachers) if changes else set()
+    divisions = set(changes.divisions) if changes else set()
+
+    touched = []
+    homes = {}   # gene idx -> previous (day, start) worth keeping
+    for g in genes:
+        p = placements.get(g.idx)
+        listed = g.div in divisions or any(t.id in teachers for t in g.teachers_list)
+        if p is not None and not listed: homes[g.idx] = p[:2]
+        if (p is None or listed
+                or not 0 <= p[0] < schedule.constants['NUM_DAYS'] or not 0 <= p[1] <= S - g.duration
+                or not schedule.is_free(p[0], p[1], g, strict_repetition_check=False)
+                or not rooms_fit(schedule, model, g, *p)):
+            touched.append(g)
+        else:
+            schedule.book(g, *p)
+
+    # Each pinned booking is evicted at most once, so this ends
+    pinned = {g.idx for g in genes if schedule.day[g.idx] != -1}
+    moved = set()
+    queue = list(touched)
+    while queue:
+        g = queue.pop(0)
+        home = homes.get(g.idx)
+        evicted = relocate(schedule, g, model, rng, pinned, [h for h in genes if h is not g and clashes(g, h)], home)
+        if home is None or (schedule.day[g.idx], schedule.slot[g.idx]) != home: moved.add(g.idx)
+        for h in evicted or ():
+            pinned.discard(h.idx)
+            queue.append(h)
+    logger.info(f"Repair: {len(genes) - len(touched)} bookings pinned, {len(touched)} touched, "
+                f"{len(moved)} re-timed")
+
+    improve(schedule, model, rng, iterations=REPAIR_ITERATIONS, cancel=cancel, deadline=deadline, movable=moved)
+    return schedule
+
+# --- EXACT BRANCH AND BOUND ---
+# Depth-first search over the same genes and Schedule: the gene with the
+# fewest remaining starts is branched on first, starts are tried cheapest
+# first, and every booking forward-checks the domains it can block (a wiped
+# out domain backtracks at once). Once every gene is placed the incumbent is
+# the lowest gaps / sparse-days cost seen; subtrees whose lower bound can't
+# beat it are cut. Rooms are picked within their pool, so "proven" assumes
+# rooms of one pool are interchangeable.
+
+EXACT_TIME_LIMIT = float(os.environ.get("EXACT_TIME_LIMIT", "10"))   # seconds
+# Larger instances go straight to the heuristic (with a note on the result):
+# the search could not finish on them within any practical time limit
+EXACT_MAX_GENES = int(os.environ.get("EXACT_MAX_GENES", "500"))
+
+OPTIMAL = "optimal"        # search finished; incumbent is optimal
+INFEASIBLE = "infeasible"  # search finished; not every gene can be placed
+TIMEOUT = "timeout"        # budget ran out; incumbent (if any) is feasible
+
+class _OutOfTime(Exception):
+    pass
+
+class ExactSearch:
+    def __init__(self, genes, model, time_limit=None, cancel=None):
+        self.genes = genes
+        self.model = model
+        self.schedule = Schedule(genes, solver_constants(model.config), model.room_index, model.reserved_rooms)
+        self.domains = Domains(self.schedule, genes, model)
+        self.constants = self.schedule.constants
+        self.time_limit = EXACT_TIME_LIMIT if time_limit is None else time_limit
+        self.cancel = cancel
+        self.rng = random.Random(0)   # room picks only
+        self.remaining = list(self.domains.static)
+        self.unplaced = set(range(len(genes)))
+        self.by_div = defaultdict(list)
+        for g in genes: self.by_div[g.div].append(g.idx)
+        self.div_bound = dict.fromkeys(self.by_div, 0)
+        self.bound = 0
+        self.best_cost = float('inf')
+        self.best_snapshot = None
+        self.nodes = 0
+
+        # Groups of genes that can never overlap in time: all genes of a
+        # teacher, and all genes of a batch plus its division's whole-class
+        # genes. A group whose open genes need more slots than their domains
+        # still cover can't be completed.
+        groups = defaultdict(set)
+        whole_genes = defaultdict(list)
+        for g in genes:
+            _, div_any, div_all, whole, batches, teachers, _ = self.schedule.encode(g)
+            for t in teachers: groups[t].add(g.idx)
+            for b in batches: groups[b].add(g.idx)
+            if whole: whole_genes[div_all].append(g.idx)
+        for g in genes:
+            _, div_any, div_all, whole, batches, _, _ = g.enc
+            for b in batches: groups[b].update(whole_genes[div_all])
+            if not batches and whole: groups[div_all].update(whole_genes[div_all])
+        self.groups = [sorted(members) for members in groups.values() if len(members) > 1]
+        self.gene_groups = defaultdict(list)
+        for k, members in enumerate(self.groups):
+            for j in members: self.gene_groups[j].append(k)
+
+    def run(self):
+        # Returns (status, best snapshot or None)
+        self.deadline = time.monotonic() + self.time_limit
+        try:
+            self.dfs()
+        except _OutOfTime:
+            return TIMEOUT, self.best_snapshot
+        return (OPTIMAL if self.best_snapshot is not None else INFEASIBLE), self.best_snapshot
+
+    def row_bounds(self, div):
+        # Lower bound on the final gap / sparse-day cost of a division: a row
+        # keeps at least span - entries - (entries its open genes could still
+        # add) gaps, and stays sparse if its open genes can't lift it to 3.
+        S, num_days = self.constants['SLOTS_PER_DAY'], self.constants['NUM_DAYS']
+        schedule = self.schedule
+        day_mask = (1 << S) - 1
+        room = [0] * num_days
+        extra = [0] * num_days
+        for j in self.by_div[div]:
+            if j not in self.unplaced: continue
+            domain, duration = self.remaining[j], self.genes[j].duration
+            for d in range(num_days):
+                if domain >> (d * S) & day_mask:
+                    room[d] += duration; extra[d] += 1
+        cost = 0
+        for d in range(num_days):
+            row = schedule.row_span(div, d)
+            if row is None: continue
+            first, last, entries, crosses = row
+            if entries > 1:
+                span = last - first + 1 - (1 if crosses else 0)
+                cost += max(0, span - entries - room[d]) * GAP_WEIGHT
+            if schedule.div_daily_count[div][d] + extra[d] < 3: cost += SPARSE_WEIGHT
+        return cost
+
+    def overloaded(self, group):
+        need = used = 0
+        for j in self.groups[group]:
+            if j not in self.unplaced: continue
+            duration = self.genes[j].duration
+            need += duration
+            used |= covered_starts(self.remaining[j] << (duration - 1), duration)
+        return need > used.bit_count()
+
+    def dfs(self):
+        # Iterative, one stack frame per gene branched on ([open gene,
+        # candidate starts, undo record of the child being explored]), so
+        # depth is not bounded by Python's recursion limit.
+        stack = []
+        frame = self.enter()
+        if frame: stack.append(frame)
+        while stack:
+            frame = stack[-1]
+            i, candidates, applied = frame
+            gene = self.genes[i]
+            if applied is not None:
+                self.retract(gene, applied)
+                frame[2] = None
+            for day, start in candidates:
+                applied = self.branch(gene, day, start)
+                if applied is None: continue
+                frame[2] = applied
+                child = self.enter()
+                if child: stack.append(child)
                 break
-            
-    return best_sched
+            else:
+                self.unplaced.add(i)
+                stack.pop()
+
+    def enter(self):
+        # Visit the current node: record a complete assignment, or open a
+        # frame for the next gene; None when there is nothing to branch on.
+        self.nodes += 1
+        if self.nodes % 256 == 0:
+            if time.monotonic() > self.deadline: raise _OutOfTime()
+            if self.cancel is not None and self.cancel.is_set(): raise _OutOfTime()
+        schedule = self.schedule
+        if not self.unplaced:
+            cost = schedule.total_gaps * GAP_WEIGHT + schedule.total_sparse * SPARSE_WEIGHT
+            if cost < self.best_cost:
+                self.best_cost = cost
+                self.best_snapshot = schedule.snapshot()
+            return None
+        if self.bound >= self.best_cost: return None
+
+        S = self.constants['SLOTS_PER_DAY']
+        i = min(self.unplaced, key=lambda j: (self.remaining[j].bit_count(), j))
+        free, costs = score_candidates(schedule, self.genes[i], self.constants, False)
+        starts = free & self.remaining[i]
+        candidates = sorted((costs[k], k) for k in range(starts.bit_length()) if starts >> k & 1)
+        self.unplaced.discard(i)
+        return [i, iter([divmod(k, S) for _, k in candidates]), None]
+
+    def branch(self, gene, day, start):
+        # Book the gene and forward-check; the undo record, or None (and
+        # nothing booked) when no rooms are free or a domain / group wipes out
+        schedule = self.schedule
+        rooms = get_rooms_for_gene(schedule, day, start, gene, self.model, self.rng)
+        if not rooms: return None
+        schedule.book(gene, day, start, rooms)
+        changes, wiped = [], False
+        for j, slots in self.domains.blocks(gene).items():
+            if j not in self.unplaced: continue
+            domain = self.remaining[j] & ~covered_starts(slots, self.genes[j].duration)
+            if domain != self.remaining[j]:
+                changes.append((j, self.remaining[j]))
+                self.remaining[j] = domain
+                if not domain: wiped = True
+        if not wiped:
+            touched = {k for j, _ in changes for k in self.gene_groups[j]}
+            wiped = any(self.overloaded(k) for k in touched)
+        if wiped:
+            for j, domain in changes: self.remaining[j] = domain
+            schedule.undo()
+            return None
+        old = self.div_bound[gene.div]
+        self.div_bound[gene.div] = self.row_bounds(gene.div)
+        self.bound += self.div_bound[gene.div] - old
+        return changes, old
+
+    def retract(self, gene, applied):
+        changes, old = applied
+        self.bound -= self.div_bound[gene.div] - old
+        self.div_bound[gene.div] = old
+        for j, domain in changes: self.remaining[j] = domain
+        self.schedule.undo()
+
+def solve(genes, model, workers=None, progress=None, cancel=None, seed=None, exact=False, metrics=None,
+          budget=None, pool=None):
+    # With a SchedulePool, pool.schedules ends up holding the alternatives
+    logger.info("--- Starting Solver (Zero Gap Aggression) ---")
+    workers = SOLVER_WORKERS if workers is None else workers
+    budget = budget or Budget()
+    timed = metrics.phase if metrics else nullcontext
+    rng = random.Random(seed) if seed is not None else random
+
+    rng.shuffle(genes) 
+    genes.sort(key=lambda g: 0 if g.type == "LAB" else (1 if g.type == "MATHS_TUT" else (2 if g.type == "ELECTIVE" else 3)))
+
+    # Exact mode: an optimal answer is final; a timed-out incumbent places
+    # everything and only goes through local search; a proven-infeasible
+    # instance still gets the heuristic, which stops once it hits the bound.
+    best_snapshot, min_unplaced = None, 0
+    if exact:
+        time_limit = None if budget.seconds is None else min(EXACT_TIME_LIMIT, EXACT_SHARE * budget.remaining())
+        engine = ExactSearch(genes, model, time_limit=time_limit, cancel=cancel)
+        with timed("exact"): status, best_snapshot = engine.run()
+        logger.info(f"Exact search: {status} after {engine.nodes} nodes (cost {engine.best_cost})")
+        if status == INFEASIBLE: min_unplaced = 1
+
+    if best_snapshot is None:
+        if workers > 1:
+            _, best_snapshot = search_parallel(genes, model, workers, rng, progress, cancel, min_unplaced, metrics,
+                                               budget, pool)
+        else:
+            _, best_snapshot = search(genes, model, range(budget.max_runs), rng, progress=progress, cancel=cancel,
+                                      min_unplaced=min_unplaced, metrics=metrics, budget=budget, pool=pool)
+    elif status == OPTIMAL:
+        schedule = Schedule(genes, solver_constants(model.config), model.room_index, model.reserved_rooms)
+        schedule.restore(best_snapshot)
+        return schedule
+
+    if best_snapshot is None: return None
+    schedule = Schedule(genes, solver_constants(model.config), model.room_index, model.reserved_rooms)
+    schedule.restore(best_snapshot)
+    first = pool.placement(schedule) if pool is not None else None
+    with timed("local_search"):
+        improve(schedule, model, rng, cancel=cancel, deadline=budget.deadline)
+        if pool is not None:
+            pool.schedules = polish_alternatives(pool, schedule, first, genes, model, rng, cancel, budget.deadline)
+    return schedule
+
+# --- FEASIBILITY PRE-CHECK ---
+# Demand against capacity before any search, in milliseconds: hours per
+# teacher against the slots their shift allows, hours per batch (whole-class
+# genes block every batch) against the week, 2-hour sessions per batch
+# against the 2-slot windows clear of recess, and room-hours per room class
+# (theory rooms, lab pool, each special room set) against a per (day, slot)
+# pigeonhole bound: at a slot a class can't hold more sessions than it has
+# rooms, nor more than the divisions able to meet then could use at once.
+# Only hard constraints count, so an "error" means some gene is certain to
+# stay unplaced; a "warning" flags a resource loaded to PRECHECK_TIGHT.
+
+PRECHECK_TIGHT = 0.95
+
+def feasibility_issue(resource, name, demand, capacity, unit):
+    if demand > capacity: level = "error"
+    elif demand >= PRECHECK_TIGHT * capacity: level = "warning"
+    else: return None
+    return {"level": level, "resource": resource, "name": name, "demand": demand, "capacity": capacity,
+            "message": f"{resource} {name}: {demand} {unit} needed, {capacity} available"}
+
+def covered_slots(gene, constants, recess_mask):
+    # Week slots any legal placement of the gene could cover
+    S, num_days = constants['SLOTS_PER_DAY'], constants['NUM_DAYS']
+    if gene.duration > S: return 0
+    shift_mask = 0
+    for t in gene.teachers_list:
+        for s in range(S):
+            if not t.is_available(s, S): shift_mask |= 1 << s
+    starts = week_starts(valid_day_starts(gene, shift_mask, S), S, num_days) & ~covered_starts(recess_mask, gene.duration)
+    covered = 0
+    for k in range(gene.duration): covered |= starts << k
+    return covered
+
+def check_feasibility(genes, model):
+    # Issues (errors first, most overloaded first) naming each bottleneck
+    constants = solver_constants(model.config)
+    S, R, num_days = constants['SLOTS_PER_DAY'], constants['RECESS_INDEX'], constants['NUM_DAYS']
+    teaching = [s for s in range(S) if s != R]
+    recess_mask = sum(1 << (d * S + R) for d in range(num_days)) if 0 <= R < S else 0
+    issues = []
+
+    # Teachers
+    load, staff = Counter(), {}
+    for g in genes:
+        for t in g.teachers_list:
+            if t.id == "-1": continue
+            load[t.id] += g.duration
+            staff[t.id] = t
+    for tid, hours in load.items():
+        t = staff[tid]
+        capacity = num_days * sum(1 for s in teaching if t.is_available(s, S))
+        issues.append(feasibility_issue("teacher", f"{t.name} ({tid}, shift {t.shift})", hours, capacity, "hours"))
+
+    # Divisions and batches
+    whole, batch_hours, batch_labs = Counter(), defaultdict(Counter), defaultdict(Counter)
+    for g in genes:
+        batches = [b for b in g.batch_ids if b != "ALL"]
+        if "ALL" in g.batch_ids or not batches: whole[g.div] += g.duration
+        for b in batches:
+            batch_hours[g.div][b] += g.duration
+            if g.duration == 2: batch_labs[g.div][b] += 1
+    week = num_days * len(teaching)
+    windows = num_days * ((R // 2 + (S - R - 1) // 2) if 0 <= R < S else S // 2)
+    for div in dict.fromkeys(g.div for g in genes):
+        if not batch_hours[div]:
+            issues.append(feasibility_issue("division", div, whole[div], week, "hours"))
+        for b, hours in batch_hours[div].items():
+            issues.append(feasibility_issue("batch", f"{div} B{b}", whole[div] + hours, week, "hours"))
+            if batch_labs[div][b]:
+                issues.append(feasibility_issue("lab blocks", f"{div} B{b}", batch_labs[div][b], windows, "2-hour sessions"))
+
+    # Room classes: class -> (name, room count); per class and division the
+    # rooms whole-class genes / each batch could need at each week slot
+    classes = {"theory": ("theory rooms", model.theory_mask.bit_count()),
+               "lab": ("lab rooms", model.lab_mask.bit_count())}
+    demand = Counter()
+    whole_need = defaultdict(lambda: defaultdict(lambda: [0] * (num_days * S)))
+    batch_need = defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: [0] * (num_days * S))))
+    for g in genes:
+        uses = []   # (class, batch or None, rooms)
+        if g.theory: uses.append(("theory", None, len(g.teachers_list)))
+        else:
+            for i, sub in enumerate(g.lab_subjects[:len(g.teachers_list)]):
+                rule, mask = model.lab_room(sub, g.type)
+                if rule == ROOM_FALLBACK: continue   # falls back to "Location TBA"
+                if rule == ROOM_SPECIAL:
+                    key = ("special", mask)
+                    if key not in classes: classes[key] = (f"special rooms [{', '.join(model.room_names(mask))}]", mask.bit_count())
+                else: key = "theory" if mask == model.theory_mask else "lab"
+                uses.append((key, g.batch_ids[i] if i < len(g.batch_ids) else None, 1))
+        if not uses: continue
+        covered = covered_slots(g, constants, recess_mask)
+        for key, batch, rooms in uses:
+            demand[key] += rooms * g.duration
+            need = whole_need[key][g.div] if batch is None else batch_need[key][g.div][batch]
+            slots = covered
+            while slots:
+                low = slots & -slots
+                k = low.bit_length() - 1
+                if need[k] < rooms: need[k] = rooms
+                slots ^= low
+    for key, (name, rooms) in classes.items():
+        if not demand[key]: continue
+        capacity = 0
+        for k in range(num_days * S):
+            usable = 0
+            for div in set(whole_need[key]) | set(batch_need[key]):
+                usable += max(whole_need[key][div][k] if div in whole_need[key] else 0,
+                              sum(need[k] for need in batch_need[key][div].values()))
+            capacity += min(rooms, usable)
+        issues.append(feasibility_issue("room class", name, demand[key], capacity, "room-hours"))
+
+    issues = [i for i in issues if i]
+    issues.sort(key=lambda i: (i["level"] != "error", -(i["demand"] / i["capacity"] if i["capacity"] else math.inf)))
+    return issues
+
+# --- DECOMPOSITION ---
+# Divisions sharing no teacher or special room (ProblemModel.components())
+# only meet in the general room pools, so each group is solved on its own and
+# the search grows with the largest group instead of the whole campus. With
+# SOLVER_WORKERS > 1 all groups are solved at once and every group that fits
+# around the ones already accepted (re-picking rooms where two groups chose
+# the same) is kept; the rest (all of them when serial) are solved one after
+# another with the accepted groups' rooms reserved.
+
+SOLVER_DECOMPOSE = os.environ.get("SOLVER_DECOMPOSE", "1") == "1"
+# Above this room load groups solved apart rarely fit together, so they go
+# straight to the sequential pass
+PARALLEL_ROOM_LOAD = 0.5
+
+def room_load(genes, model, constants):
+    # Share of the theory / lab room pool (the busier one) the genes would
+    # fill over the week
+    S, R = constants['SLOTS_PER_DAY'], constants['RECESS_INDEX']
+    usable = constants['NUM_DAYS'] * (S - 1 if 0 <= R < S else S)
+    theory = lab = 0
+    for g in genes:
+        if g.type == "LAB": lab += len(g.teachers_list) * g.duration
+        else: theory += len(g.teachers_list) * g.duration
+    return max(theory / max(1, model.theory_mask.bit_count() * usable),
+               lab / max(1, model.lab_mask.bit_count() * usable))
+
+# Cancel event of worker processes that run whole solves (groups, scenarios)
+_stop = None
+
+def _init_stop(stop):
+    global _stop
+    _stop = stop
+
+def _component_worker(genes, model, seed, budget):
+    schedule = solve(list(genes), model, workers=1, cancel=_stop, seed=seed, budget=budget)
+    if schedule is None: return None
+    return [(schedule.day[g.idx], schedule.slot[g.idx], schedule.rooms[g.idx]) for g in genes]
+
+def solve_decomposed(genes, model, components, workers=None, progress=None, cancel=None, seed=None,
+                     metrics=None, budget=None):
+    workers = SOLVER_WORKERS if workers is None else workers
+    budget = budget or Budget()
+    rng = random.Random(seed) if seed is not None else random
+    constants = solver_constants(model.config)
+    S = constants['SLOTS_PER_DAY']
+    by_div = defaultdict(list)
+    for g in genes: by_div[g.div].append(g)
+    parts = [part for part in ([g for div in comp for g in by_div[div]] for comp in components) if part]
+    seeds = [rng.randrange(2 ** 32) if seed is not None else None for _ in parts]
+    logger.info(f"Decomposed into {len(parts)} groups of {[len(part) for part in parts]} genes")
+
+    # Room masks per week slot held by accepted parts; placements per part
+    # as (day, start, rooms) in part order
+    reserved = list(model.reserved_rooms or [0] * (constants['NUM_DAYS'] * S))
+    placements = [None] * len(parts)
+
+    def rooms_of(part, placement):
+        # (week slot, room mask) pairs held by a part's bookings
+        for g, (day, start, rooms) in zip(part, placement):
+            if day == -1: continue
+            mask = model.room_mask(r for r in rooms if r in model.room_index)
+            for k in range(day * S + start, day * S + start + g.duration): yield k, mask
+
+    def accept(k, placement):
+        placements[k] = placement
+        for slot, mask in rooms_of(parts[k], placement): reserved[slot] |= mask
+
+    def fit_rooms(k, placement):
+        # A part solved alone, with rooms taken since re-picked at the same
+        # slots; None if some booking finds no rooms there
+        taken = list(reserved)
+        fitted = []
+        for g, (day, start, rooms) in zip(parts[k], placement):
+            if day != -1:
+                span = range(day * S + start, day * S + start + g.duration)
+                mask = model.room_mask(r for r in rooms if r in model.room_index)
+                if any(taken[slot] & mask for slot in span):
+                    busy = 0
+                    for slot in span: busy |= taken[slot]
+                    rooms = pick_rooms(~busy, g, model, rng)
+                    if rooms is None: return None
+                    mask = model.room_mask(r for r in rooms if r in model.room_index)
+                for slot in span: taken[slot] |= mask
+            fitted.append((day, start, rooms))
+        return fitted
+
+    if workers > 1 and len(parts) > 1 and room_load(genes, model, constants) <= PARALLEL_ROOM_LOAD:
+        ctx = multiprocessing.get_context("spawn")
+        stop = ctx.Event()
+        with ProcessPoolExecutor(max_workers=min(workers, len(parts)), mp_context=ctx,
+                                 initializer=_init_stop, initargs=(stop,)) as executor:
+            futures = [executor.submit(_component_worker, part, model, part_seed, budget)
+                       for part, part_seed in zip(parts, seeds)]
+            pending = futures
+            while pending:
+                _, pending = wait(pending, timeout=PROGRESS_INTERVAL)
+                if cancel is not None and cancel.is_set(): stop.set()
+            results = [f.result() for f in futures]
+        for k, placement in enumerate(results):
+            if placement is not None: placement = fit_rooms(k, placement)
+            if placement is not None: accept(k, placement)
+
+    left = [k for k in range(len(parts)) if placements[k] is None]
+    if len(left) < len(parts):
+        logger.info(f"{len(parts) - len(left)} groups solved in parallel, {len(left)} re-solved with reservations")
+    remaining_genes = sum(len(parts[k]) for k in left)
+    for k in left:
+        part = parts[k]
+        # solve() reorders the list it gets; `part` keeps the placement order
+        schedule = solve(list(part), model.variant(reserved_rooms=reserved), workers=workers, progress=progress,
+                         cancel=cancel, seed=seeds[k], metrics=metrics, budget=budget.share(len(part) / remaining_genes))
+        remaining_genes -= len(part)
+        if schedule is None: continue
+        accept(k, [(schedule.day[g.idx], schedule.slot[g.idx], schedule.rooms[g.idx]) for g in part])
+
+    schedule = Schedule(genes, constants, model.room_index, model.reserved_rooms)
+    for part, placement in zip(parts, placements):
+        if placement is None: continue
+        for g, (day, start, rooms) in zip(part, placement):
+            if day != -1: schedule.book(g, day, start, rooms)
+    # Genes a group left unplaced may fit around the other groups' bookings
+    if any(day == -1 for day in schedule.day):
+        with (metrics.phase("local_search") if metrics else nullcontext()):
+            improve(schedule, model, rng, cancel=cancel, deadline=budget.deadline)
+    return schedule
 
 # ==========================================
-# 4. API ENDPOINT
+# 4. REQUEST PIPELINE
 # ==========================================
 
-@app.post("/generate-timetable")
-async def generate_timetable(req: TimetableRequest):
-    teachers_map = {t.id: Teacher(t) for t in req.faculty}
-    special_rooms = defaultdict(list)
-    for r in req.rooms:
-        if r.special_assignment:
-            special_rooms[r.special_assignment].append(r.name)
-
+def build_genes(model):
+    teachers_map = {t.id: Teacher(t) for t in model.teachers}
     genes = []
-    all_subjects_flat = []
-    for year_list in req.subjects.values():
-        all_subjects_flat.extend(year_list)
 
-    div_allocs = defaultdict(lambda: defaultdict(list))
-    
-    for alloc in req.allocations:
-        if not alloc.teacher_id: continue
-        parts = alloc.division.split('-')
-        
-        if len(parts) >= 3: 
-            base_div = f"{parts[0]}-{parts[1]}"
-            batch_id = parts[2].replace(parts[1], '') 
-            div_allocs[base_div]['LABS'].append({
-                'batch': batch_id, 'subject': alloc.subject_name, 'teacher_id': alloc.teacher_id
-            })
-        elif re.search(r"\d$", alloc.division): 
-            base_div = alloc.division[:-1]; batch_id = alloc.division[-1]
-            div_allocs[base_div]['LABS'].append({
-                'batch': batch_id, 'subject': alloc.subject_name, 'teacher_id': alloc.teacher_id
-            })
-        else: 
-            div_allocs[alloc.division]['THEORY'].append({
-                'subject': alloc.subject_name, 'teacher_id': alloc.teacher_id
-            })
-
-    for div, types in div_allocs.items():
+    for div, types in model.div_allocs.items():
         # A. LABS & TUTORIALS
         lab_entries = types['LABS']
         batch_buckets = defaultdict(list)
@@ -495,7 +1924,7 @@ async def generate_timetable(req: TimetableRequest):
         
         for b_id, entries in batch_buckets.items():
             for entry in entries:
-                s_info = next((s for s in all_subjects_flat if s.name == entry['subject']), None)
+                s_info = model.subject(entry['subject'])
                 if not s_info and not entry['subject'].lower().endswith('tut'): 
                     continue 
 
@@ -559,7 +1988,7 @@ async def generate_timetable(req: TimetableRequest):
         electives = defaultdict(list)
         theory_list = []
         for item in types['THEORY']:
-            s_info = next((s for s in all_subjects_flat if s.name == item['subject']), None)
+            s_info = model.subject(item['subject'])
             if not s_info: continue
             t = teachers_map.get(item['teacher_id'], DummyTeacher())
             t.assign_load(s_info.weekly_load)
@@ -576,7 +2005,7 @@ async def generate_timetable(req: TimetableRequest):
             elec_subjects = list(electives.keys())
             elec_teachers = []
             for sub in elec_subjects:
-                s_info = next((s for s in all_subjects_flat if s.name == sub), None)
+                s_info = model.subject(sub)
                 load = s_info.weekly_load if s_info else 3
                 max_load = max(max_load, load)
                 elec_teachers.append(electives[sub][0])
@@ -585,44 +2014,428 @@ async def generate_timetable(req: TimetableRequest):
                          teachers_list=elec_teachers, lab_subjects=elec_subjects, batch_ids=["ALL"])
                 genes.append(g)
 
-    # --- RUN SOLVER ---
-    schedule = solve(genes, req.config, req.resources, req.home_rooms, special_rooms)
+    return genes
+
+def format_entry(g, slot, rooms):
+    entry = {
+        "slot": slot, "duration": g.duration, "type": g.type, "subject": g.subject,
+        "teacher": "TBA", "room": "TBA"
+    }
     
-    if not schedule:
-        raise HTTPException(status_code=500, detail="Unable to generate schedule")
+    if g.type in ["LAB", "MATHS_TUT"]:
+        entry["batches"] = []
+        for i, sub in enumerate(g.lab_subjects):
+            t_name = g.teachers_list[i].name if i < len(g.teachers_list) else "TBA"
+            r_name = rooms[i] if i < len(rooms) else "TBA"
+            b_id = g.batch_ids[i] if i < len(g.batch_ids) else "?"
+            entry["batches"].append({
+                "batch": f"B{b_id}", "subject": sub, "teacher": t_name, "room": r_name
+            })
+        entry["subject"] = " / ".join(dict.fromkeys(g.lab_subjects))
+        entry["teacher"] = "Multiple"
+        entry["room"] = "Multiple"
+        
+    elif g.type == "ELECTIVE":
+        entry["subject"] = " / ".join(g.lab_subjects)
+        entry["teacher"] = " / ".join([t.name for t in g.teachers_list])
+        entry["room"] = " / ".join(rooms)
+        
+    else: # THEORY
+        entry["teacher"] = g.teachers_list[0].name
+        entry["room"] = rooms[0]
+    return entry
 
+def format_output(schedule, model):
     output = defaultdict(lambda: defaultdict(list))
-    days_lookup = req.config.days
+    days_lookup = model.config.days
     
     for g in schedule.genes:
-        if g.day == -1: continue
-        entry = {
-            "slot": g.slot, "duration": g.duration, "type": g.type, "subject": g.subject,
-            "teacher": "TBA", "room": "TBA"
-        }
-        
-        if g.type in ["LAB", "MATHS_TUT"]:
-            entry["batches"] = []
-            for i, sub in enumerate(g.lab_subjects):
-                t_name = g.teachers_list[i].name if i < len(g.teachers_list) else "TBA"
-                r_name = g.assigned_rooms[i] if i < len(g.assigned_rooms) else "TBA"
-                b_id = g.batch_ids[i] if i < len(g.batch_ids) else "?"
-                entry["batches"].append({
-                    "batch": f"B{b_id}", "subject": sub, "teacher": t_name, "room": r_name
+        day, rooms = schedule.day[g.idx], schedule.rooms[g.idx]
+        if day == -1: continue
+        output[g.div][days_lookup[day]].append(format_entry(g, schedule.slot[g.idx], rooms))
+
+    return output
+
+def entry_key(div, entry):
+    # What identifies the gene behind an output entry: everything but its
+    # slot and rooms
+    batches = tuple((b.get("batch"), b.get("subject"), b.get("teacher")) for b in entry.get("batches") or ())
+    return (div, entry.get("type"), entry.get("subject"), entry.get("teacher"), entry.get("duration"), batches)
+
+def entry_rooms(entry):
+    # Room names of an output entry, in gene order
+    if entry.get("batches"): return [b.get("room") for b in entry["batches"]]
+    if entry.get("type") == "ELECTIVE": return str(entry.get("room")).split(" / ")
+    return [entry.get("room")]
+
+# Bump when solver changes would produce different timetables for the same
+# request, so stale on-disk cache entries stop matching.
+SOLVER_VERSION = 4
+
+def once(factory):
+    # The result cache, schedule store and job manager are built on first
+    # use, not at import: spawned solver workers import this module too and
+    # must not open the store or create cache directories.
+    lock = threading.Lock()
+    def get():
+        with lock:
+            if not hasattr(get, "value"): get.value = factory()
+        return get.value
+    return get
+
+@once
+def result_cache():
+    return ResultCache(
+        max_entries=int(os.environ.get("RESULT_CACHE_SIZE", "64")),
+        max_age=float(os.environ.get("RESULT_CACHE_TTL", "86400")),
+        directory=os.environ.get("RESULT_CACHE_DIR") or None,
+    )
+
+# SOLVER_METRICS=1 instruments every solve, not only requests asking for it
+SOLVER_METRICS = os.environ.get("SOLVER_METRICS", "0") == "1"
+solver_metrics = MetricsRegistry()
+
+# Solved timetables are kept in SQLite (SCHEDULE_DB="" turns the store off)
+SCHEDULE_DB = os.environ.get("SCHEDULE_DB", "schedules.db")
+
+@once
+def schedule_store():
+    return ScheduleStore(SCHEDULE_DB) if SCHEDULE_DB else None
+
+def solve_model(req, model, genes, budget, seed, progress=None, cancel=None, metrics=None, workers=None, pool=None,
+                report=None):
+    # Repair when the request carries a previous timetable, else a full solve
+    if req.previous is not None:
+        rng = random.Random(seed) if seed is not None else random
+        with (metrics.phase("repair") if metrics else nullcontext()):
+            return repair(genes, model, req.previous, req.changes, rng, cancel=cancel, deadline=budget.deadline)
+    exact = req.solver == "exact"
+    if exact and len(genes) > EXACT_MAX_GENES:
+        note = f"Exact search skipped: {len(genes)} genes is over EXACT_MAX_GENES ({EXACT_MAX_GENES}); solved heuristically"
+        logger.warning(note)
+        if report: report("note", note)
+        exact = False
+    if SOLVER_DECOMPOSE and not exact and pool is None:
+        components = model.components()
+        if len(components) > 1:
+            return solve_decomposed(genes, model, components, workers=workers, progress=progress, cancel=cancel,
+                                    seed=seed, metrics=metrics, budget=budget)
+    return solve(genes, model, workers=workers, progress=progress, cancel=cancel, seed=seed,
+                 exact=exact, metrics=metrics, budget=budget, pool=pool)
+
+def run_timetable(req, progress=None, cancel=None, report=None):
+    # `report(key, value)` receives "config" (for exports of the result),
+    # "converged" (the result meets the search's stop criterion), the stored
+    # "schedule_id" / "version", "feasibility" (pre-check issues), "note"
+    # (e.g. the exact search was skipped) and, for an instrumented solve,
+    # "metrics".
+    report = report or (lambda key, value: None)
+    report("config", req.config)
+    key = request_key(req.model_dump(mode="json", exclude={"name"}), SOLVER_VERSION)
+    cached = result_cache().get(key)
+    if cached is not None:
+        logger.info(f"Cache hit {key[:12]}")
+        # The pre-check report is cached with the result, so a hit reports
+        # (and rejects) the same as the solve that filled it
+        if cached.get("feasibility") is not None: apply_precheck(req, cached["feasibility"], report)
+        report("converged", cached["converged"])
+        store_result(req, key, cached["timetable"], cached["converged"], report)
+        return cached["timetable"]
+
+    metrics = SolveMetrics() if req.metrics or SOLVER_METRICS else None
+    timed = metrics.phase if metrics else nullcontext
+    budget = Budget(req.max_runs, req.time_budget_ms)
+    with timed("compile"):
+        model = compile_model(req)
+    for warning in model.room_warnings: logger.warning(warning)
+    with timed("gene_build"):
+        genes = build_genes(model)
+    issues = None
+    if req.precheck != "off":
+        with timed("precheck"):
+            issues = check_feasibility(genes, model)
+        apply_precheck(req, issues, report)
+    alternatives = min(req.alternatives, MAX_ALTERNATIVES)
+    pool = SchedulePool(genes, alternatives + 1) if alternatives > 0 else None
+    schedule = solve_model(req, model, genes, budget, req.seed, progress=progress, cancel=cancel, metrics=metrics,
+                           pool=pool, report=report)
+    
+    if not schedule:
+        raise HTTPException(status_code=500, detail="Unable to generate schedule")
+    unplaced = [g for g in genes if schedule.day[g.idx] == -1]
+    converged = is_converged(unplaced, *schedule.calculate_gaps_and_sparse())
+    report("converged", converged)
+    if budget.expired() and not converged:
+        logger.info(f"Time budget of {req.time_budget_ms} ms used up; returning the best schedule found")
+    with timed("output"):
+        output = format_output(schedule, model)
+        if pool is not None:
+            best, rows = pool.placement(schedule), []
+            for alt in pool.schedules:
+                gaps, sparse_days = alt.calculate_gaps_and_sparse()
+                rows.append({
+                    "timetable": format_output(alt, model),
+                    "unplaced": sum(1 for g in genes if alt.day[g.idx] == -1), "gaps": gaps, "sparse_days": sparse_days,
+                    "distance": pool.distance(pool.placement(alt), best),
                 })
-            entry["subject"] = " / ".join(set(g.lab_subjects))
-            entry["teacher"] = "Multiple"
-            entry["room"] = "Multiple"
-            
-        elif g.type == "ELECTIVE":
-            entry["subject"] = " / ".join(g.lab_subjects)
-            entry["teacher"] = " / ".join([t.name for t in g.teachers_list])
-            entry["room"] = " / ".join(g.assigned_rooms)
-            
-        else: # THEORY
-            entry["teacher"] = g.teachers_list[0].name
-            entry["room"] = g.assigned_rooms[0]
-            
-        output[g.div][days_lookup[g.day]].append(entry)
+            output = {"timetable": output, "alternatives": rows}
+    if metrics:
+        solver_metrics.record(metrics)
+        report("metrics", metrics.as_dict())
+    # Cancelled solves only hold a best-so-far answer; don't serve it again.
+    if not (cancel is not None and cancel.is_set()):
+        result_cache().put(key, {"timetable": output, "converged": converged, "feasibility": issues})
+        store_result(req, key, output, converged, report)
+    return output
+
+def apply_precheck(req, issues, report):
+    # Logs and reports pre-check issues; under "reject" any error is a 422
+    for issue in issues: logger.warning(f"Pre-check {issue['level']}: {issue['message']}")
+    report("feasibility", issues)
+    errors = [issue for issue in issues if issue["level"] == "error"]
+    if errors and req.precheck == "reject":
+        raise HTTPException(status_code=422, detail={
+            "message": f"Infeasible input: {errors[0]['message']}", "issues": errors})
+
+def store_result(req, key, output, converged, report):
+    # Saves the timetable (the best one, with alternatives) as a version of req.name
+    store = schedule_store()
+    if store is None: return
+    timetable = output["timetable"] if req.alternatives > 0 else output
+    out = set(req.changes.rooms if req.changes else ())
+    rooms = [r for r in dict.fromkeys(list(req.resources.theory_rooms) + list(req.resources.lab_rooms) +
+                                      [r.name for r in req.rooms]) if r not in out]
+    try:
+        schedule_id, version = store.save(req.name, timetable, req.config, rooms, key, converged)
+    except sqlite3.Error as e:
+        # The timetable is still returned, just without a stored version
+        logger.warning(f"Saving schedule {req.name!r} failed: {e}")
+        return
+    report("schedule_id", schedule_id)
+    report("version", version)
+
+# --- SCENARIO BATCHES ---
+# What-if variants of one request. The base request is validated and compiled
+# once; each scenario is a ProblemModel.variant() of it, solved in its own
+# worker process (one serial solve per scenario, several scenarios at once).
+
+# SCENARIO_WORKERS=0 (default) means one worker per core
+SCENARIO_WORKERS = int(os.environ.get("SCENARIO_WORKERS", "0")) or (os.cpu_count() or 1)
+
+
+def scenario_model(model, scenario):
+    config = None
+    if scenario.config is not None:
+        config = model.config.model_copy(update=scenario.config.model_dump(exclude_none=True))
+    return model.variant(config=config, lab_rooms=scenario.add_lab_rooms, theory_rooms=scenario.add_theory_rooms,
+                         removed_rooms=scenario.remove_rooms, shifts=scenario.shifts)
+
+def _scenario_worker(req, model, seed):
+    genes = build_genes(model)
+    budget = Budget(req.max_runs, req.time_budget_ms)
+    schedule = solve_model(req, model, genes, budget, seed, cancel=_stop, workers=1)
+    if not schedule: return None
+    unplaced = [g for g in genes if schedule.day[g.idx] == -1]
+    gaps, sparse_days = schedule.calculate_gaps_and_sparse()
+    return {
+        "unplaced": len(unplaced), "gaps": gaps, "sparse_days": sparse_days,
+        "converged": is_converged(unplaced, gaps, sparse_days),
+        "timetable": {div: dict(days) for div, days in format_output(schedule, model).items()},
+    }
 
-    return output
\ No newline at end of file
+def run_scenarios(batch, progress=None, cancel=None, report=None):
+    # -> {"scenarios": [{name, unplaced, gaps, sparse_days, converged,
+    # timetable}, ...]} in request order; progress counts finished scenarios.
+    report = report or (lambda key, value: None)
+    req = batch.base
+    model = compile_model(req)
+    for warning in model.room_warnings: logger.warning(warning)
+    variants = [scenario_model(model, s) for s in batch.scenarios]
+    if not variants: return {"scenarios": []}
+
+    ctx = multiprocessing.get_context("spawn")
+    stop = ctx.Event()
+    with ProcessPoolExecutor(max_workers=min(SCENARIO_WORKERS, len(variants)), mp_context=ctx,
+                             initializer=_init_stop, initargs=(stop,)) as pool:
+        futures = [pool.submit(_scenario_worker, req, m, req.seed if s.seed is None else s.seed)
+                   for s, m in zip(batch.scenarios, variants)]
+        pending = futures
+        while pending:
+            _, pending = wait(pending, timeout=PROGRESS_INTERVAL)
+            if cancel is not None and cancel.is_set(): stop.set()
+            if progress: progress({"scenarios_done": len(futures) - len(pending), "scenarios_total": len(futures)})
+        results = [f.result() for f in futures]
+
+    rows = []
+    for s, result in zip(batch.scenarios, results):
+        if result is None: rows.append({"name": s.name, "error": "Unable to generate schedule"})
+        else: rows.append({"name": s.name, **result})
+    report("converged", all(row.get("converged") for row in rows))
+    return {"scenarios": rows}
+
+# ==========================================
+# 5. API ENDPOINTS
+# ==========================================
+
+# Solves run on a small thread pool so the event loop keeps serving other
+# requests; each solve can still fan out to processes via SOLVER_WORKERS.
+@once
+def jobs():
+    return JobManager(max_workers=int(os.environ.get("JOB_WORKERS", "2")))
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+@app.get("/metrics")
+async def get_metrics():
+    job_counts = Counter(job.status for job in list(jobs().jobs.values()))
+    gauges = [("timetable_jobs", "Jobs in the registry, by status.",
+               {f'status="{status}"': job_counts[status] for status in (QUEUED, RUNNING, DONE, FAILED, CANCELLED)})]
+    return PlainTextResponse(solver_metrics.render(gauges), media_type="text/plain; version=0.0.4")
+
+@app.post("/generate-timetable")
+async def generate_timetable(req: TimetableRequest):
+    # The body stays the bare timetable; whether the solver converged before
+    # its budget ran out goes in a header.
+    job = jobs().submit(run_timetable, req)
+    result = await jobs().wait(job)
+    converged = job.details.get("converged")
+    headers = {"X-Timetable-Converged": "true" if converged else "false"}
+    if job.details.get("schedule_id") is not None:
+        headers["X-Schedule-Id"] = str(job.details["schedule_id"])
+        headers["X-Schedule-Version"] = str(job.details["version"])
+    if job.details.get("note"): headers["X-Timetable-Note"] = job.details["note"]
+    return JSONResponse(result, headers=headers)
+
+@app.post("/feasibility")
+async def feasibility(req: TimetableRequest):
+    # The pre-check alone: demand against capacity, no search
+    model = compile_model(req)
+    issues = check_feasibility(build_genes(model), model)
+    return {"feasible": not any(issue["level"] == "error" for issue in issues), "issues": issues}
+
+@app.post("/scenarios")
+async def run_scenario_batch(batch: ScenarioBatch):
+    job = jobs().submit(run_scenarios, batch)
+    return await jobs().wait(job)
+
+@app.post("/jobs", status_code=202)
+async def create_job(req: TimetableRequest):
+    job = jobs().submit(run_timetable, req)
+    return job.summary()
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    return jobs().get(job_id).summary()
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    job = jobs().get(job_id)
+    job.cancel.set()
+    return job.summary()
+
+def export_response(timetable, config, format, view):
+    media_type, chunks = export(timetable, config, format, view)
+    return StreamingResponse(chunks, media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="timetable-{view}.{format}"'})
+
+@app.post("/export")
+async def export_timetable(req: ExportRequest, format: Literal["html", "csv", "xlsx"] = "html",
+                           view: Literal["division", "teacher", "room", "all"] = "all"):
+    # Division, teacher and room timetables of a stored timetable
+    return export_response(req.timetable, req.config, format, view)
+
+@app.get("/jobs/{job_id}/export")
+async def export_job(job_id: str, format: Literal["html", "csv", "xlsx"] = "html",
+                     view: Literal["division", "teacher", "room", "all"] = "all"):
+    job = jobs().get(job_id)
+    config = job.details.get("config")
+    if job.result is None or config is None:
+        raise HTTPException(status_code=409, detail=f"Job {job_id} has no timetable to export")
+    timetable = job.result["timetable"] if "alternatives" in job.result else job.result
+    return export_response(timetable, config, format, view)
+
+# --- STORED SCHEDULES ---
+
+def stored_schedule(schedule_id):
+    if schedule_store() is None:
+        raise HTTPException(status_code=404, detail="The schedule store is disabled")
+    stored = schedule_store().get(schedule_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail=f"Unknown schedule {schedule_id}")
+    return stored
+
+def day_number(stored, day):
+    # Day name (or index) -> index into the stored config's days
+    days = stored["config"]["days"]
+    if day in days: return days.index(day)
+    if day.isdigit() and int(day) < len(days): return int(day)
+    raise HTTPException(status_code=422, detail=f"Unknown day {day}")
+
+def with_day_names(stored, sessions):
+    days = stored["config"]["days"]
+    return [{**s, "day": days[s["day"]], "continued": bool(s["continued"])} for s in sessions]
+
+@app.get("/schedules")
+async def list_schedules(name: Optional[str] = None):
+    # Every stored version (of one name), oldest first
+    store = schedule_store()
+    return store.versions(name) if store is not None else []
+
+@app.get("/schedules/{schedule_id}")
+async def get_schedule(schedule_id: int):
+    return stored_schedule(schedule_id)
+
+@app.get("/schedules/{schedule_id}/{owner}/{name}")
+async def get_schedule_sessions(schedule_id: int, owner: Literal["teacher", "room", "division"], name: str,
+                                day: Optional[str] = None):
+    # A teacher's, room's or division's week (or one day of it)
+    stored = stored_schedule(schedule_id)
+    d = day_number(stored, day) if day is not None else None
+    return with_day_names(stored, schedule_store().sessions(schedule_id, owner, name, d))
+
+@app.get("/schedules/{schedule_id}/free-rooms")
+async def get_free_rooms(schedule_id: int, day: str, slot: int):
+    stored = stored_schedule(schedule_id)
+    busy = schedule_store().busy_rooms(schedule_id, day_number(stored, day), slot)
+    return [r for r in stored["rooms"] if r not in busy]
+
+@app.get("/schedules/{schedule_id}/free-slots")
+async def get_free_slots(schedule_id: int, owner: Literal["teacher", "room", "division"], name: str,
+                         day: Optional[str] = None):
+    # Teaching slots (recess excluded) a teacher, room or division has free
+    stored = stored_schedule(schedule_id)
+    config = stored["config"]
+    busy = schedule_store().busy_slots(schedule_id, owner, name)
+    days = [day_number(stored, day)] if day is not None else range(len(config["days"]))
+    return [{"day": config["days"][d], "slot": s} for d in days for s in range(config["slots_per_day"])
+            if s != config["recess_index"] and (d, s) not in busy]
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job(job_id: str):
+    # Server-Sent Events: one "progress" event per new report (the solver
+    # already throttles them), then a final "end" event with the summary.
+    job = jobs().get(job_id)
+
+    async def events():
+        seen = -1
+        while True:
+            if job.version != seen:
+                seen = job.version
+                yield f"event: progress\ndata: {json.dumps(job.progress)}\n\n"
+            if job.finished is not None:
+                yield f"event: end\ndata: {json.dumps(job.summary())}\n\n"
+                return
+            await asyncio.sleep(PROGRESS_INTERVAL)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    job = jobs().get(job_id)
+    if job.status == FAILED: raise job.error
+    if job.result is None:
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is {job.status}")
+    return job.result
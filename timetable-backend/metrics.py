@@ -0,0 +1,91 @@
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+# ==========================================
+# SOLVER INSTRUMENTATION
+# ==========================================
+# Off unless a request asks for it (or SOLVER_METRICS=1): solver functions
+# take a SolveMetrics or None, and every hook sits behind `if metrics`.
+
+# Why a start construct() tried could not be used (first matching reason)
+REJECTIONS = ("shift", "teacher_clash", "batch_clash", "repetition", "room_shortage")
+
+class SolveMetrics:
+    def __init__(self):
+        self.timers = defaultdict(float)   # phase -> seconds
+        self.counters = Counter()          # rejection reason -> starts
+        self.runs = 0
+        self.runs_to_best = None           # run count when the best run was found
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timers[name] += time.perf_counter() - started
+
+    def merge(self, data):
+        # Fold in as_dict() of a parallel worker; runs_to_best is set by the caller
+        for name, seconds in data["timers"].items(): self.timers[name] += seconds
+        self.counters.update(data["rejections"])
+        self.runs += data["runs"]
+
+    def as_dict(self):
+        return {
+            "timers": {name: round(seconds, 6) for name, seconds in self.timers.items()},
+            "rejections": {reason: self.counters[reason] for reason in REJECTIONS},
+            "runs": self.runs,
+            "runs_to_best": self.runs_to_best,
+        }
+
+class MetricsRegistry:
+    # Process-wide totals over instrumented solves, rendered for /metrics
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.solves = 0
+        self.timers = defaultdict(float)
+        self.counters = Counter()
+        self.runs = 0
+        self.runs_to_best = 0
+
+    def record(self, metrics):
+        with self.lock:
+            self.solves += 1
+            for name, seconds in metrics.timers.items(): self.timers[name] += seconds
+            self.counters.update(metrics.counters)
+            self.runs += metrics.runs
+            self.runs_to_best += metrics.runs_to_best or 0
+
+    def render(self, gauges=()):
+        # Prometheus text format. `gauges` adds (name, help, {label: value}) rows.
+        with self.lock:
+            lines = [
+                "# HELP timetable_solves_total Instrumented solves.",
+                "# TYPE timetable_solves_total counter",
+                f"timetable_solves_total {self.solves}",
+                "# HELP timetable_phase_seconds_total Time spent per solver phase.",
+                "# TYPE timetable_phase_seconds_total counter",
+            ]
+            lines += [f'timetable_phase_seconds_total{{phase="{name}"}} {seconds:.6f}'
+                      for name, seconds in sorted(self.timers.items())]
+            lines += [
+                "# HELP timetable_rejections_total Candidate starts rejected, by reason.",
+                "# TYPE timetable_rejections_total counter",
+            ]
+            lines += [f'timetable_rejections_total{{reason="{reason}"}} {self.counters[reason]}'
+                      for reason in REJECTIONS]
+            lines += [
+                "# HELP timetable_runs_total Construction runs.",
+                "# TYPE timetable_runs_total counter",
+                f"timetable_runs_total {self.runs}",
+                "# HELP timetable_runs_to_best_total Sum over solves of the run that found the best schedule.",
+                "# TYPE timetable_runs_to_best_total counter",
+                f"timetable_runs_to_best_total {self.runs_to_best}",
+            ]
+        for name, help_text, values in gauges:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+            lines += [f'{name}{{{label}}} {value}' for label, value in values.items()]
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,198 @@
+import copy
+import re
+from collections import defaultdict
+
+# ==========================================
+# COMPILED PROBLEM MODEL
+# ==========================================
+# Built once per request. Every lookup the gene builder and the solver need
+# (subject by name, allocations of a division, batch of a division string,
+# teacher / room ids, special rooms) is an index here instead of a scan over
+# the raw request. Treat a compiled model as read-only: scenarios and
+# parallel workers share it.
+
+# How a lab / tutorial batch gets its room (see ProblemModel.lab_room)
+ROOM_FALLBACK = "fallback"   # PROJECT / LIBRARY: random free theory room, else "Location TBA"
+ROOM_SPECIAL = "special"     # first free room of its special assignment, else unplaceable
+ROOM_POOL = "pool"           # random free lab room (theory room for MATHS_TUT)
+
+def normalize_key(s):
+    return re.sub(r'[^a-zA-Z0-9]', '', s).lower().replace('maths', 'math')
+
+def parse_division(division):
+    # "SE-A" -> ("SE-A", None); "SE-A-A1" -> ("SE-A", "1"); "SE-A1" -> ("SE-A", "1")
+    parts = division.split('-')
+    if len(parts) >= 3:
+        return f"{parts[0]}-{parts[1]}", parts[2].replace(parts[1], '')
+    if re.search(r"\d$", division):
+        return division[:-1], division[-1]
+    return division, None
+
+class ProblemModel:
+    def __init__(self, req):
+        self.config = req.config
+        self.resources = req.resources
+        self.home_rooms = dict(req.home_rooms)
+
+        # Subject table; by name the first definition wins
+        self.subjects = tuple(s for year_list in req.subjects.values() for s in year_list)
+        self.subject_index = {}
+        for i, s in enumerate(self.subjects):
+            self.subject_index.setdefault(s.name, i)
+
+        # Teacher table; a repeated id keeps its last definition
+        self.teachers = tuple(req.faculty)
+        self.teacher_index = {t.id: i for i, t in enumerate(self.teachers)}
+
+        # Room table over every room name the request mentions
+        names = list(req.resources.theory_rooms) + list(req.resources.lab_rooms)
+        names += [r.name for r in req.rooms] + list(self.home_rooms.values())
+        self.rooms = tuple(dict.fromkeys(names))
+        self.room_index = {r: i for i, r in enumerate(self.rooms)}
+
+        self.special_rooms = {}
+        for r in req.rooms:
+            if r.special_assignment:
+                self.special_rooms.setdefault(r.special_assignment, []).append(r.name)
+
+        # Per week slot masks of room ids booked by another part of a
+        # decomposed solve (see variant()); None = no reservations
+        self.reserved_rooms = None
+        # Rooms a change set takes out of service leave every pool
+        self.out_of_service = frozenset(r for r in (req.changes.rooms if req.changes else ()) if r in self.room_index)
+        self._room_pools()
+
+        # Division string -> (base division, batch id or None), parsed once
+        self.batch_map = {}
+        # Base division -> {'LABS': [...], 'THEORY': [...]} in request order
+        self.div_allocs = {}
+        for alloc in req.allocations:
+            if not alloc.teacher_id: continue
+            parsed = self.batch_map.get(alloc.division)
+            if parsed is None:
+                parsed = self.batch_map[alloc.division] = parse_division(alloc.division)
+
+            base_div, batch_id = parsed
+            groups = self.div_allocs.setdefault(base_div, {'LABS': [], 'THEORY': []})
+            if batch_id is not None:
+                groups['LABS'].append({
+                    'batch': batch_id, 'subject': alloc.subject_name, 'teacher_id': alloc.teacher_id
+                })
+            else:
+                groups['THEORY'].append({
+                    'subject': alloc.subject_name, 'teacher_id': alloc.teacher_id
+                })
+
+        self._resolve_lab_rooms()
+
+    def _room_pools(self):
+        # Room pools as masks over room ids (bit i = self.rooms[i]); special
+        # rooms are kept out of the general lab pool.
+        out = self.room_mask(self.out_of_service)
+        self.theory_mask = self.room_mask(self.resources.theory_rooms) & ~out
+        reserved = self.room_mask(r for rooms in self.special_rooms.values() for r in rooms)
+        self.lab_mask = self.room_mask(self.resources.lab_rooms) & ~reserved & ~out
+        self.special_masks = {k: self.room_mask(rooms) & ~out for k, rooms in self.special_rooms.items()}
+
+    def variant(self, config=None, lab_rooms=(), theory_rooms=(), removed_rooms=(), shifts=None,
+                reserved_rooms=None):
+        # What-if copy sharing everything the changes don't touch (subjects,
+        # allocations, parsed divisions): another config, extra rooms, rooms
+        # out of service, teacher id -> shift overrides or room reservations.
+        m = copy.copy(self)
+        if config is not None: m.config = config
+        if reserved_rooms is not None: m.reserved_rooms = reserved_rooms
+        if shifts:
+            m.teachers = tuple(t.model_copy(update={"shift": shifts[t.id]}) if t.id in shifts else t
+                               for t in self.teachers)
+        if lab_rooms or theory_rooms or removed_rooms:
+            m.resources = self.resources.model_copy(update={
+                "lab_rooms": list(dict.fromkeys(list(self.resources.lab_rooms) + list(lab_rooms))),
+                "theory_rooms": list(dict.fromkeys(list(self.resources.theory_rooms) + list(theory_rooms))),
+            })
+            m.rooms = tuple(dict.fromkeys(self.rooms + tuple(theory_rooms) + tuple(lab_rooms)))
+            m.room_index = {r: i for i, r in enumerate(m.rooms)}
+            m.out_of_service = self.out_of_service | {r for r in removed_rooms if r in m.room_index}
+            m._room_pools()
+            m._resolve_lab_rooms()
+        return m
+
+    def subject(self, name):
+        i = self.subject_index.get(name)
+        return self.subjects[i] if i is not None else None
+
+    def _resolve_lab_rooms(self):
+        # (subject, gene type) -> (rule, room mask) for every batch subject,
+        # so room picking never matches names. Mapping problems are collected
+        # in room_warnings.
+        self.lab_room_rules = {}
+        self.room_warnings = []
+        special_keys = [(k, normalize_key(k)) for k in self.special_rooms]
+        used_keys = set()
+        subjects = dict.fromkeys(a['subject'] for groups in self.div_allocs.values() for a in groups['LABS'])
+        for name in subjects:
+            if name == 'PROJECT' or name == 'LIBRARY':
+                rule = (ROOM_FALLBACK, self.theory_mask)
+                self.lab_room_rules[(name, "LAB")] = self.lab_room_rules[(name, "MATHS_TUT")] = rule
+                continue
+            norm = normalize_key(name)
+            matches = [k for k, nk in special_keys if nk in norm or norm in nk]
+            if len(matches) > 1:
+                self.room_warnings.append(f"Subject '{name}' matches special rooms {matches}; using '{matches[0]}'")
+            if matches:
+                used_keys.add(matches[0])
+                rule = (ROOM_SPECIAL, self.special_masks[matches[0]])
+                self.lab_room_rules[(name, "LAB")] = self.lab_room_rules[(name, "MATHS_TUT")] = rule
+            else:
+                self.lab_room_rules[(name, "LAB")] = (ROOM_POOL, self.lab_mask)
+                self.lab_room_rules[(name, "MATHS_TUT")] = (ROOM_POOL, self.theory_mask)
+        for k in self.special_rooms:
+            if k not in used_keys:
+                self.room_warnings.append(f"Special rooms for '{k}' ({', '.join(self.special_rooms[k])}) match no lab subject")
+
+    def components(self):
+        # Divisions grouped by the coupling graph, largest group first. Two
+        # divisions are linked when they share a teacher or a special room
+        # (electives are per division, so their groups link through teachers
+        # too); different groups only compete for the general room pools.
+        parent = {div: div for div in self.div_allocs}
+        def find(div):
+            while parent[div] != div:
+                parent[div] = parent[parent[div]]
+                div = parent[div]
+            return div
+
+        owner = {}   # teacher id / special room id -> first division using it
+        for div, groups in self.div_allocs.items():
+            keys = [('teacher', a['teacher_id']) for a in groups['LABS'] + groups['THEORY']
+                    if a['teacher_id'] in self.teacher_index]
+            for a in groups['LABS']:
+                rule, mask = self.lab_room_rules[(a['subject'], "LAB")]
+                if rule == ROOM_SPECIAL: keys += [('room', r) for r in self.room_names(mask)]
+            for key in keys:
+                if key in owner: parent[find(div)] = find(owner[key])
+                else: owner[key] = div
+
+        groups = defaultdict(list)
+        for div in self.div_allocs: groups[find(div)].append(div)
+        return sorted(groups.values(), key=len, reverse=True)
+
+    def lab_room(self, subject, gene_type):
+        return self.lab_room_rules[(subject, gene_type)]
+
+    def room_mask(self, names):
+        mask = 0
+        for r in names: mask |= 1 << self.room_index[r]
+        return mask
+
+    def room_names(self, mask):
+        # Room names of the set bits, lowest id first
+        names = []
+        while mask:
+            low = mask & -mask
+            names.append(self.rooms[low.bit_length() - 1])
+            mask ^= low
+        return names
+
+def compile_model(req):
+    return ProblemModel(req)
@@ -0,0 +1,41 @@
+# ==========================================
+# BITSET OCCUPANCY ENGINE
+# ==========================================
+# Every teacher, room, division and batch is interned to a small integer and
+# owns ONE int for the whole week: bit (day * slots_per_day + slot) is set
+# while that entity is busy. "Is X free for slots s..s+d on day D" is then a
+# single AND against a span mask instead of a walk through nested dicts.
+
+TEACHER = "teacher"
+DIV_ANY = "div"       # some batch (or the whole division) is busy
+DIV_ALL = "div_all"   # the whole division ("ALL") is busy
+BATCH = "batch"       # one lab / tutorial batch of a division is busy
+
+
+class Occupancy:
+    def __init__(self, num_days, slots_per_day):
+        self.num_days = num_days
+        self.slots_per_day = slots_per_day
+        # (kind, key) -> entity id, interned on first use by this schedule
+        self.index = {}
+        self.busy = []
+
+    def entity(self, kind, key):
+        eid = self.index.get((kind, key))
+        if eid is None:
+            eid = self.index[(kind, key)] = len(self.index)
+        if eid >= len(self.busy):
+            self.busy.extend([0] * (eid + 1 - len(self.busy)))
+        return eid
+
+    def bit(self, day, slot):
+        return 1 << (day * self.slots_per_day + slot)
+
+    def span(self, day, start, duration):
+        return ((1 << duration) - 1) << (day * self.slots_per_day + start)
+
+    def occupy(self, eid, mask):
+        self.busy[eid] |= mask
+
+    def release(self, eid, mask):
+        self.busy[eid] &= ~mask
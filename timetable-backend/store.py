@@ -0,0 +1,130 @@
+import json
+import sqlite3
+import threading
+import time
+
+from export import TimetableIndex
+
+# ==========================================
+# PERSISTENT SCHEDULE STORE
+# ==========================================
+# Solved timetables saved to SQLite. Each save is a new version under a
+# name, so older timetables stay retrievable without re-solving. Alongside
+# the JSON, every timetable is flattened into one `sessions` row per
+# (session, covered slot), indexed for the teacher / room / division
+# lookups. Saving a name again with the same request key returns the
+# stored version instead of adding one.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS schedules (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    created REAL NOT NULL,
+    request_key TEXT,
+    converged INTEGER,
+    config TEXT NOT NULL,      -- days, slots_per_day, recess_index
+    rooms TEXT NOT NULL,       -- every room in service, for free-room queries
+    timetable TEXT NOT NULL,   -- as returned by /generate-timetable
+    UNIQUE (name, version)
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    schedule_id INTEGER NOT NULL REFERENCES schedules (id) ON DELETE CASCADE,
+    division TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    slot INTEGER NOT NULL,
+    type TEXT,
+    subject TEXT,
+    teacher TEXT,
+    room TEXT,
+    batch TEXT,
+    continued INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_teacher ON sessions (schedule_id, teacher);
+CREATE INDEX IF NOT EXISTS sessions_room ON sessions (schedule_id, room, day, slot);
+CREATE INDEX IF NOT EXISTS sessions_division ON sessions (schedule_id, division, day);
+CREATE INDEX IF NOT EXISTS sessions_slot ON sessions (schedule_id, day, slot);
+"""
+
+SESSION_COLUMNS = ("division", "day", "slot", "type", "subject", "teacher", "room", "batch", "continued")
+# Column a free-slot / session lookup filters on, by owner kind
+OWNERS = {"teacher": "teacher", "room": "room", "division": "division"}
+
+class ScheduleStore:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        with self.lock, self.db:
+            if path != ":memory:": self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA foreign_keys=ON")
+            self.db.executescript(SCHEMA)
+
+    def save(self, name, timetable, config, rooms, key=None, converged=None):
+        # -> (schedule id, version)
+        with self.lock, self.db:
+            latest = self.db.execute(
+                "SELECT id, version, request_key FROM schedules WHERE name = ? ORDER BY version DESC LIMIT 1",
+                (name,)).fetchone()
+            if latest is not None and key is not None and latest["request_key"] == key:
+                return latest["id"], latest["version"]
+            version = latest["version"] + 1 if latest else 1
+            stored_config = {"days": list(config.days), "slots_per_day": config.slots_per_day,
+                             "recess_index": config.recess_index}
+            schedule_id = self.db.execute(
+                "INSERT INTO schedules (name, version, created, request_key, converged, config, rooms, timetable) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (name, version, time.time(), key, None if converged is None else int(converged),
+                 json.dumps(stored_config), json.dumps(list(rooms)), json.dumps(timetable))).lastrowid
+            index = TimetableIndex(timetable, config.days, config.slots_per_day)
+            self.db.executemany(
+                f"INSERT INTO sessions (schedule_id, {', '.join(SESSION_COLUMNS)}) VALUES (?{', ?' * len(SESSION_COLUMNS)})",
+                ((schedule_id, div, d, s, kind, subject, teacher, room, batch, int(continued))
+                 for grid in index.cells["division"].values()
+                 for (d, s), records in grid.items()
+                 for div, kind, subject, teacher, room, batch, continued in records))
+            return schedule_id, version
+
+    def versions(self, name=None):
+        query = "SELECT id, name, version, created, converged FROM schedules"
+        args = ()
+        if name is not None: query, args = query + " WHERE name = ?", (name,)
+        with self.lock:
+            rows = self.db.execute(query + " ORDER BY name, version", args).fetchall()
+        return [self._summary(row) for row in rows]
+
+    def get(self, schedule_id):
+        # Stored schedule with its config and timetable, or None
+        with self.lock:
+            row = self.db.execute("SELECT * FROM schedules WHERE id = ?", (schedule_id,)).fetchone()
+        if row is None: return None
+        return {**self._summary(row), "config": json.loads(row["config"]), "rooms": json.loads(row["rooms"]),
+                "timetable": json.loads(row["timetable"])}
+
+    def sessions(self, schedule_id, owner, name, day=None):
+        # Sessions of one teacher / room / division in day, slot order
+        column = OWNERS[owner]
+        query = f"SELECT {', '.join(SESSION_COLUMNS)} FROM sessions WHERE schedule_id = ? AND {column} = ?"
+        args = (schedule_id, name)
+        if day is not None: query, args = query + " AND day = ?", args + (day,)
+        with self.lock:
+            rows = self.db.execute(query + " ORDER BY day, slot, division", args).fetchall()
+        return [dict(row) for row in rows]
+
+    def busy_slots(self, schedule_id, owner, name):
+        # {(day, slot)} an owner is booked in
+        with self.lock:
+            rows = self.db.execute(f"SELECT DISTINCT day, slot FROM sessions WHERE schedule_id = ? AND {OWNERS[owner]} = ?",
+                                   (schedule_id, name)).fetchall()
+        return {(row["day"], row["slot"]) for row in rows}
+
+    def busy_rooms(self, schedule_id, day, slot):
+        with self.lock:
+            rows = self.db.execute("SELECT DISTINCT room FROM sessions WHERE schedule_id = ? AND day = ? AND slot = ?",
+                                   (schedule_id, day, slot)).fetchall()
+        return {row["room"] for row in rows}
+
+    def _summary(self, row):
+        return {"schedule_id": row["id"], "name": row["name"], "version": row["version"], "created": row["created"],
+                "converged": None if row["converged"] is None else bool(row["converged"])}
@@ -0,0 +1,76 @@
+import random
+
+# ==========================================
+# SYNTHETIC INSTANCE GENERATOR
+# ==========================================
+# Builds TimetableRequest payloads (plain JSON data) of any size for the
+# benchmark suite. `tightness` is the share of a batch's teaching slots
+# (days x slots, minus recess) its own timetable fills: whole-class theory
+# and electives plus its labs and tutorial. Near 1.0 instances get hard,
+# above 1.0 they are infeasible by construction. `departments` repeats the
+# years per department (SE1, SE2, ...) with a staff of `teachers` each,
+# sharing only the rooms.
+
+SHIFTS = ["A", "B", "9-5"]
+
+def generate(seed=0, years=("SE", "TE", "BE"), divisions=2, batches=3, teachers=24,
+             theory_rooms=6, lab_rooms=6, electives=2, labs=3, special_labs=1,
+             tightness=0.8, days=5, slots_per_day=9, recess_index=4, departments=1):
+    rng = random.Random(seed)
+    day_names = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"][:days]
+    capacity = days * (slots_per_day - (1 if 0 <= recess_index < slots_per_day else 0))
+
+    faculty = [{
+        "id": f"T{i}", "name": f"Teacher {i}", "role": "Faculty",
+        "experience": rng.randint(1, 20), "shift": rng.choice(SHIFTS)
+    } for i in range(1, teachers * departments + 1)]
+    next_teacher = iter(range(10 ** 9))
+    def teacher(dept):
+        return f"T{dept * teachers + next(next_teacher) % teachers + 1}"
+
+    theory = [f"TR{i}" for i in range(1, theory_rooms + 1)]
+    lab = [f"LR{i}" for i in range(1, lab_rooms + 1)]
+    rooms = []
+    special_rooms = lab[-special_labs:] if special_labs else []
+
+    subjects, allocations, division_map, home_rooms = {}, [], {}, {}
+    for dept, y in ((d, y if departments == 1 else f"{y}{d + 1}") for d in range(departments) for y in years):
+        # Per batch: labs are one 2h session each, the tutorial one slot, the
+        # elective block runs `elective_load` times; theory fills the rest.
+        elective_load = 2 if electives else 0
+        target = round(tightness * capacity)
+        theory_slots = max(1, target - 2 * labs - 1 - elective_load)
+        n_theory = max(1, round(theory_slots / 4))
+        loads = [theory_slots // n_theory + (1 if i < theory_slots % n_theory else 0) for i in range(n_theory)]
+
+        subs = [{"name": f"{y} Theory {i + 1}", "code": f"{y}T{i + 1}", "type": "Theory", "weekly_load": load}
+                for i, load in enumerate(loads)]
+        subs += [{"name": f"{y} Elective {i + 1}", "code": f"{y}E{i + 1}", "type": "Elective", "weekly_load": elective_load}
+                 for i in range(electives)]
+        subs += [{"name": f"{y} Lab {i + 1}", "code": f"{y}L{i + 1}", "type": "Lab", "weekly_load": 2, "duration": 2}
+                 for i in range(labs)]
+        subs.append({"name": f"{y} Maths Tut", "code": f"{y}MT", "type": "Tutorial", "weekly_load": 1, "duration": 1})
+        # The first labs of a year may need a special room
+        for i, room in enumerate(special_rooms):
+            if i < labs: rooms.append({"name": room, "type": "Lab", "special_assignment": f"{y} Lab {i + 1}"})
+        subjects[y] = subs
+
+        division_map[y] = [f"{y}-{chr(65 + d)}" for d in range(divisions)]
+        for div in division_map[y]:
+            if len(home_rooms) < len(theory): home_rooms[div] = theory[len(home_rooms)]
+            letter = div.split("-")[1]
+            for s in subs:
+                if s["type"] in ("Theory", "Elective"):
+                    allocations.append({"teacher_id": teacher(dept), "subject_name": s["name"], "division": div})
+                else:
+                    for b in range(1, batches + 1):
+                        allocations.append({"teacher_id": teacher(dept), "subject_name": s["name"],
+                                            "division": f"{div}-{letter}{b}"})
+
+    return {
+        "config": {"slots_per_day": slots_per_day, "recess_index": recess_index, "days": day_names},
+        "resources": {"lab_rooms": lab, "theory_rooms": theory},
+        "subjects": subjects, "lab_prefs": {}, "home_rooms": home_rooms,
+        "faculty": faculty, "allocations": allocations, "divisions": division_map,
+        "rooms": rooms, "seed": seed,
+    }
@@ -0,0 +1,28 @@
+import inspect
+import os
+import sys
+
+import pytest
+
+# Flat imports as under `uvicorn main:app`; no schedule store or disk cache
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["SCHEDULE_DB"] = ""
+os.environ.setdefault("SOLVER_WORKERS", "1")
+
+import main
+from synthetic import generate
+
+# generate() keywords; `seed` is left to the request
+INSTANCE_ARGS = set(inspect.signature(generate).parameters) - {"seed"}
+
+@pytest.fixture
+def make_request():
+    # TimetableRequest for a small synthetic instance: instance keywords
+    # (years, divisions, theory_rooms, ...) go to generate(), the rest
+    # override request fields
+    def make(years=("SE", "TE"), divisions=1, **overrides):
+        instance = {k: overrides.pop(k) for k in list(overrides) if k in INSTANCE_ARGS}
+        payload = generate(seed=0, years=years, divisions=divisions, **instance)
+        payload.update({"seed": 1, "max_runs": 5, **overrides})
+        return main.TimetableRequest(**payload)
+    return make
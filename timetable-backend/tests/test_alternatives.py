@@ -0,0 +1,12 @@
+import main
+
+def test_alternatives_are_diverse(make_request):
+    req = make_request(alternatives=2, max_runs=50)
+    result = main.run_timetable(req)
+    assert set(result) == {"timetable", "alternatives"}
+    model = main.compile_model(req)
+    min_distance = main.SchedulePool(main.build_genes(model), 3).min_distance
+    assert result["alternatives"]
+    for alt in result["alternatives"]:
+        assert alt["distance"] >= min_distance
+        assert alt["timetable"] != result["timetable"]
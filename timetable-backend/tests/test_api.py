@@ -0,0 +1,21 @@
+import asyncio
+
+import pytest
+from fastapi.middleware.cors import CORSMiddleware
+from pydantic import ValidationError
+
+import main
+
+@pytest.mark.parametrize("field, value", [("max_runs", 0), ("max_runs", -3), ("time_budget_ms", 0)])
+def test_budget_fields_are_validated(make_request, field, value):
+    with pytest.raises(ValidationError):
+        make_request(**{field: value})
+
+def test_custom_headers_are_exposed_cross_origin(make_request, monkeypatch):
+    cors = next(m for m in main.app.user_middleware if m.cls is CORSMiddleware)
+    exposed = {h.lower() for h in cors.kwargs["expose_headers"]}
+    monkeypatch.setattr(main, "EXACT_MAX_GENES", 1)   # skipped exact search: sets X-Timetable-Note
+    response = asyncio.run(main.generate_timetable(make_request(solver="exact")))
+    custom = {h for h in response.headers if h.startswith("x-")}
+    assert "x-timetable-note" in custom
+    assert custom <= exposed
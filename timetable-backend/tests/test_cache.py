@@ -0,0 +1,24 @@
+import os
+
+from cache import ResultCache, request_key
+
+def test_key_ignores_field_order():
+    assert request_key({"a": 1, "b": [2]}, 1) == request_key({"b": [2], "a": 1}, 1)
+    assert request_key({"a": 1}, 1) != request_key({"a": 1}, 2)
+
+def test_disk_tier_survives_a_new_cache(tmp_path):
+    ResultCache(directory=str(tmp_path)).put("k", {"timetable": {}, "converged": True})
+    assert ResultCache(directory=str(tmp_path)).get("k") == {"timetable": {}, "converged": True}
+
+def test_failed_disk_write_keeps_the_result(tmp_path):
+    directory = tmp_path / "cache"
+    cache = ResultCache(directory=str(directory))
+    os.rmdir(directory)
+    cache.put("k", {"converged": False})
+    assert cache.get("k") == {"converged": False}
+    assert not directory.exists()
+
+def test_lru_bound():
+    cache = ResultCache(max_entries=2)
+    for k in "abc": cache.put(k, k)
+    assert cache.get("a") is None and cache.get("c") == "c"
@@ -0,0 +1,22 @@
+import main
+
+def test_independent_departments_are_solved_apart(make_request, monkeypatch):
+    # Two departments without special labs share only the general room pools
+    req = make_request(years=("SE",), divisions=2, departments=2, special_labs=0)
+    model = main.compile_model(req)
+    assert len(model.components()) == 2
+    calls = []
+    solve_decomposed = main.solve_decomposed
+    monkeypatch.setattr(main, "solve_decomposed", lambda *a, **k: calls.append(a) or solve_decomposed(*a, **k))
+    genes = main.build_genes(model)
+    schedule = main.solve_model(req, model, genes, main.Budget(max_runs=5), 1, workers=1)
+    assert calls
+    assert all(schedule.day[g.idx] != -1 for g in genes)
+    # Rooms picked per group never clash once the groups are put together
+    booked = set()
+    for g in genes:
+        for room in schedule.rooms[g.idx]:
+            if room not in model.room_index: continue
+            for s in range(schedule.slot[g.idx], schedule.slot[g.idx] + g.duration):
+                assert (room, schedule.day[g.idx], s) not in booked
+                booked.add((room, schedule.day[g.idx], s))
@@ -0,0 +1,37 @@
+import random
+import sys
+
+import main
+
+def compiled(req):
+    model = main.compile_model(req)
+    return req, model, main.build_genes(model)
+
+def test_small_instance_is_solved_optimally(make_request):
+    _, model, genes = compiled(make_request(years=("SE",)))
+    engine = main.ExactSearch(genes, model, time_limit=30)
+    status, snapshot = engine.run()
+    assert status == main.OPTIMAL
+    assert {i for i, *_ in snapshot} == set(range(len(genes)))
+
+def test_search_depth_is_not_bounded_by_recursion_limit(make_request):
+    # One level per gene: a recursive search would blow a limit this low
+    _, model, genes = compiled(make_request(years=("SE", "TE", "BE"), divisions=2))
+    random.Random(0).shuffle(genes)
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(len(genes) // 2)
+    try:
+        status, _ = main.ExactSearch(genes, model, time_limit=1).run()
+    finally:
+        sys.setrecursionlimit(limit)
+    assert status in (main.OPTIMAL, main.TIMEOUT, main.INFEASIBLE)
+
+def test_large_instance_falls_back_to_heuristic_with_note(monkeypatch, make_request):
+    monkeypatch.setattr(main, "EXACT_MAX_GENES", 50)
+    req, model, genes = compiled(make_request())
+    req.solver = "exact"
+    notes = {}
+    schedule = main.solve_model(req, model, genes, main.Budget(max_runs=5), 1, workers=1,
+                                report=notes.__setitem__)
+    assert schedule is not None
+    assert "Exact search skipped" in notes["note"]
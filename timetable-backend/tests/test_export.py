@@ -0,0 +1,37 @@
+import csv
+import io
+
+import pytest
+from fastapi import HTTPException
+
+import export
+import main
+
+@pytest.fixture
+def solved(make_request):
+    req = make_request()
+    return main.run_timetable(req), req.config
+
+def test_teacher_view_lists_every_theory_session(solved):
+    timetable, config = solved
+    _, chunks = export.export(timetable, config, "csv", "teacher")
+    rows = list(csv.DictReader(io.StringIO("".join(chunks))))
+    listed = {(r["name"], r["day"], int(r["slot"]), r["division"]) for r in rows}
+    for div, days in timetable.items():
+        for day, entries in days.items():
+            for e in entries:
+                if e["type"] == "THEORY": assert (e["teacher"], day, e["slot"], div) in listed
+
+def test_html_has_one_section_per_division_and_the_recess(solved):
+    timetable, config = solved
+    media_type, chunks = export.export(timetable, config, "html", "division")
+    page = "".join(chunks)
+    assert media_type.startswith("text/html")
+    assert page.count("<section>") == len(timetable)
+    assert "RECESS" in page
+
+def test_xlsx_without_openpyxl_is_not_implemented(solved, monkeypatch):
+    monkeypatch.setattr(export, "openpyxl", None)
+    with pytest.raises(HTTPException) as missing:
+        export.export(*solved, "xlsx")
+    assert missing.value.status_code == 501
@@ -0,0 +1,23 @@
+import pytest
+from fastapi import HTTPException
+
+import main
+
+@pytest.fixture
+def overloaded(make_request):
+    # Two divisions sharing one theory room: 60 room-hours against 40
+    return lambda **overrides: make_request(years=("SE",), divisions=2, theory_rooms=1, **overrides)
+
+def test_theory_room_shortage_is_an_error(overloaded):
+    model = main.compile_model(overloaded())
+    issues = main.check_feasibility(main.build_genes(model), model)
+    assert [i["name"] for i in issues if i["level"] == "error"] == ["theory rooms"]
+
+def test_cache_hit_still_reports_and_rejects(overloaded):
+    first, second = {}, {}
+    main.run_timetable(overloaded(), report=first.__setitem__)
+    main.run_timetable(overloaded(), report=second.__setitem__)
+    assert second["feasibility"] == first["feasibility"]
+    with pytest.raises(HTTPException) as rejected:
+        main.run_timetable(overloaded(precheck="reject"))
+    assert rejected.value.status_code == 422
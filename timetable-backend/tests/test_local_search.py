@@ -0,0 +1,16 @@
+import random
+
+import main
+
+def test_moves_keep_to_start_slots(make_request):
+    # All but one gene start unplaced, so local search places them itself
+    model = main.compile_model(make_request())
+    genes = main.build_genes(model)
+    schedule = main.Schedule(genes, main.solver_constants(model.config), model.room_index, model.reserved_rooms)
+    S, R = model.config.slots_per_day, model.config.recess_index
+    assert main.place(schedule, genes[0], 0, main.lab_blocks(S, R)[0], model, random.Random(0))
+    main.improve(schedule, model, random.Random(0), iterations=3000)
+    placed = [g for g in genes if schedule.day[g.idx] != -1]
+    assert len(placed) > 1
+    for g in placed:
+        assert main.start_slots(g, S, R) >> schedule.slot[g.idx] & 1, (g.type, schedule.slot[g.idx])
@@ -0,0 +1,31 @@
+import json
+
+import pytest
+
+import main
+
+def entries(timetable):
+    return {(div, day, json.dumps(e, sort_keys=True)) for div, days in timetable.items()
+            for day, es in days.items() for e in es}
+
+def placements(timetable):
+    # (division, day, slot, what) of every entry, rooms left out
+    return {(div, day, e["slot"], main.entry_key(div, e))
+            for div, days in timetable.items() for day, entries in days.items() for e in entries}
+
+@pytest.fixture
+def solve(make_request):
+    return lambda **overrides: main.run_timetable(make_request(theory_rooms=8, **overrides))
+
+def test_unchanged_request_keeps_every_booking(solve):
+    previous = solve()
+    assert entries(solve(previous=previous)) == entries(previous)
+
+def test_room_out_of_service_keeps_slots(solve):
+    previous = solve()
+    room = "TR1"
+    assert any(room in main.entry_rooms(e) for days in previous.values() for es in days.values() for e in es)
+    repaired = solve(previous=previous, changes={"rooms": [room]})
+    assert not any(room in main.entry_rooms(e) for days in repaired.values() for es in days.values() for e in es)
+    # Spare theory rooms: every booking that lost TR1 gets a new room at its old slot
+    assert placements(repaired) == placements(previous)
@@ -0,0 +1,24 @@
+import main
+
+def covered(timetable):
+    # Slots any entry of the timetable covers
+    return {s for days in timetable.values() for entries in days.values()
+            for e in entries for s in range(e["slot"], e["slot"] + e["duration"])}
+
+def test_recess_patch_moves_the_recess(make_request):
+    batch = main.ScenarioBatch(base=make_request(), scenarios=[
+        {"name": "recess at 4"},
+        {"name": "recess at 3", "config": {"recess_index": 3}},
+    ])
+    rows = {row["name"]: row for row in main.run_scenarios(batch)["scenarios"]}
+    assert 4 not in covered(rows["recess at 4"]["timetable"])
+    assert 3 not in covered(rows["recess at 3"]["timetable"])
+    assert 4 in covered(rows["recess at 3"]["timetable"])
+
+def test_solver_follows_request_recess(make_request):
+    req = make_request(config={"slots_per_day": 9, "recess_index": 5, "days": ["Mon", "Tue", "Wed", "Thu", "Fri"]})
+    model = main.compile_model(req)
+    assert main.solver_constants(model.config)["RECESS_INDEX"] == 5
+    assert main.lab_blocks(9, 5) == [0, 2, 6]
+    schedule = main.solve_model(req, model, main.build_genes(model), main.Budget(max_runs=5), 1, workers=1)
+    assert 5 not in covered(main.format_output(schedule, model))
@@ -0,0 +1,76 @@
+import random
+from collections import defaultdict
+
+import main
+
+def recomputed(schedule):
+    # (gaps, sparse days) straight from the placements, no running stats
+    S, R = schedule.constants['SLOTS_PER_DAY'], schedule.constants['RECESS_INDEX']
+    entries, genes_on = defaultdict(lambda: [0] * S), defaultdict(int)
+    for g in schedule.genes:
+        d, s = schedule.day[g.idx], schedule.slot[g.idx]
+        if d == -1: continue
+        for k in range(s, s + g.duration): entries[(g.div, d)][k] += 1
+        genes_on[(g.div, d)] += 1
+    gaps = sparse = 0
+    for row, cells in entries.items():
+        used = [k for k in range(S) if cells[k]]
+        if not used: continue
+        count = sum(cells)
+        if count > 1:
+            span = used[-1] - used[0] + 1 - (1 if used[0] < R < used[-1] else 0)
+            gaps += max(0, span - count)
+        if 0 < genes_on[row] < 3: sparse += 1
+    return gaps, sparse
+
+def occupancy(schedule):
+    # Busy mask per (kind, key) entity, ids aside
+    return {key: schedule.occ.busy[eid] for key, eid in schedule.occ.index.items() if schedule.occ.busy[eid]}
+
+def replayed(schedule, model):
+    # A fresh schedule holding the same bookings, in the same order
+    fresh = main.Schedule(schedule.genes, schedule.constants, model.room_index, model.reserved_rooms)
+    for i, day, start, rooms in schedule.snapshot(): fresh.book(schedule.genes[i], day, start, rooms)
+    return fresh
+
+def test_running_stats_match_a_recompute(make_request):
+    # Random book / unbook in any order / reset; the running totals, the
+    # vectorised feasibility and the occupancy state must stay exact
+    model = main.compile_model(make_request())
+    genes = main.build_genes(model)
+    constants = main.solver_constants(model.config)
+    S, num_days = constants['SLOTS_PER_DAY'], constants['NUM_DAYS']
+    schedule = main.Schedule(genes, constants, model.room_index, model.reserved_rooms)
+    rng = random.Random(0)
+    for step in range(3000):
+        placed = [g for g in genes if schedule.day[g.idx] != -1]
+        unplaced = [g for g in genes if schedule.day[g.idx] == -1]
+        roll = rng.random()
+        if roll < 0.005:
+            schedule.reset()
+        elif placed and (roll < 0.4 or not unplaced):
+            schedule.unbook(rng.choice(placed))
+        else:
+            g = rng.choice(unplaced)
+            free, _ = main.score_candidates(schedule, g, constants)
+            for d in range(num_days):
+                for s in range(S):
+                    assert bool(free >> (d * S + s) & 1) == schedule.is_free(d, s, g), (step, g, d, s)
+            starts = [k for k in range(num_days * S) if free >> k & 1]
+            rng.shuffle(starts)
+            for k in starts:
+                d, s = divmod(k, S)
+                rooms = main.get_rooms_for_gene(schedule, d, s, g, model, rng)
+                if rooms:
+                    schedule.book(g, d, s, rooms)
+                    break
+        assert schedule.calculate_gaps_and_sparse() == recomputed(schedule), step
+        assert sorted(schedule.log) == sorted(g.idx for g in genes if schedule.day[g.idx] != -1)
+        if step % 50 == 0:
+            fresh = replayed(schedule, model)
+            assert occupancy(schedule) == occupancy(fresh), step
+            assert (schedule.room_busy, schedule.theory_rooms_used) == (fresh.room_busy, fresh.theory_rooms_used), step
+    schedule.reset()
+    assert schedule.calculate_gaps_and_sparse() == (0, 0)
+    assert not any(schedule.occ.busy) and not any(schedule.theory_rooms_used)
+    assert schedule.room_busy == (list(model.reserved_rooms) if model.reserved_rooms else [0] * (num_days * S))
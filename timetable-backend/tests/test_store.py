@@ -0,0 +1,27 @@
+import main
+from store import ScheduleStore
+
+def test_versions_and_lookups(make_request, monkeypatch):
+    store = ScheduleStore(":memory:")
+    monkeypatch.setattr(main, "schedule_store", lambda: store)
+    req = make_request(name="term")
+    reported = {}
+    timetable = main.run_timetable(req, report=reported.__setitem__)
+    assert reported["version"] == 1
+    # Same request again: the stored version is returned, not a new one
+    main.run_timetable(req, report=reported.__setitem__)
+    assert [v["version"] for v in store.versions("term")] == [1]
+    stored = store.get(reported["schedule_id"])
+    assert stored["timetable"] == timetable
+    teacher = next(e["teacher"] for days in timetable.values() for es in days.values() for e in es
+                   if e.get("type") == "THEORY")
+    assert store.sessions(reported["schedule_id"], "teacher", teacher)
+    assert store.busy_slots(reported["schedule_id"], "teacher", teacher)
+
+def test_failed_save_still_returns_the_timetable(make_request, monkeypatch):
+    store = ScheduleStore(":memory:")
+    store.db.execute("PRAGMA query_only=ON")
+    monkeypatch.setattr(main, "schedule_store", lambda: store)
+    reported = {}
+    timetable = main.run_timetable(make_request(name="read-only"), report=reported.__setitem__)
+    assert timetable and "schedule_id" not in reported
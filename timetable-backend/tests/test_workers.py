@@ -0,0 +1,12 @@
+import main
+
+def test_spawned_workers_leave_the_store_and_cache_alone(make_request, monkeypatch, tmp_path):
+    # Workers re-import main; neither the store nor the cache directory may appear
+    db, cache = tmp_path / "workers.db", tmp_path / "cache"
+    monkeypatch.setenv("SCHEDULE_DB", str(db))
+    monkeypatch.setenv("RESULT_CACHE_DIR", str(cache))
+    req = make_request()
+    model = main.compile_model(req)
+    schedule = main.solve_model(req, model, main.build_genes(model), main.Budget(max_runs=4), 1, workers=2)
+    assert schedule is not None
+    assert not db.exists() and not cache.exists()